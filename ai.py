@@ -1,226 +1,478 @@
-import copy
+import time
+from board import Board, inverse_symmetries, symmetries
+from book import DEFAULT_BOOK, load_book
+from ordering import HeuristicOrdering
+from stats import SearchStats
+from transposition import EXACT, LOWER, UPPER, O_TO_MOVE, TranspositionTable
+
+# Playouts per move of the MCTS engine when it has neither a time nor a playout budget.
+DEFAULT_PLAYOUTS = 1000
+
+# The score of a won game, less one per ply from the root to the win. Scores
+# at least WIN_THRESHOLD away from 0 are proven wins or losses; the static
+# evaluation never comes close.
+WIN_SCORE = 1 << 20
+WIN_THRESHOLD = WIN_SCORE - 1024
+
+
+def is_win_score(score):
+    """
+    Check if a search score is a proven win or loss rather than an evaluation.
+    """
+    return abs(score) >= WIN_THRESHOLD
+
+
+def score_to_tt(score, depth):
+    """
+    Make a win score found at a depth relative to that node, for the transposition table.
+
+    The table is shared by every depth, so wins are stored by their distance
+    from the node rather than from the root.
+    """
+    if score >= WIN_THRESHOLD:
+        return score + depth
+    if score <= -WIN_THRESHOLD:
+        return score - depth
+    return score
+
+
+def score_from_tt(score, depth):
+    """
+    Turn a win score from the transposition table back into a distance from the root.
+    """
+    if score >= WIN_THRESHOLD:
+        return score - depth
+    if score <= -WIN_THRESHOLD:
+        return score + depth
+    return score
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when its deadline has passed.
+    """
 
 class MiniMax:
-    def __init__(self, max_depth=4):
+    def __init__(self, max_depth=4, tt_size=1 << 16, tt_replacement='depth', ordering=None,
+                 trace=0, on_trace=None, on_iteration=None, radius=None):
         """
         Initialize the MiniMax algorithm with a specified maximum depth.
 
+        The search counts its nodes, static evaluations, cutoffs and
+        transposition table hits in plain attributes, which AI.eval collects
+        into a SearchStats after each move. Tracing reports every move scored
+        in the top trace plies of the tree and is skipped entirely at 0.
+
         Args:
             max_depth (int): The maximum depth for the MiniMax algorithm.
+            tt_size (int): The number of slots in the transposition table.
+            tt_replacement (str): The transposition table replacement policy, 'depth' or 'always'.
+            ordering (MoveOrdering): The move ordering stage, HeuristicOrdering by default.
+            trace (int): How many plies from the root to report moves for, 0 for none.
+            on_trace (callable): Called as on_trace(depth, player, move, score) for each
+                traced move; the move is printed if not given.
+            on_iteration (callable): Called as on_iteration(stats) after each completed
+                iteration of an iterative deepening search.
+            radius (int): Only search moves within this many squares of a mark, or None for all moves.
         """
         self.max_depth = max_depth
-
-    def alphabeta(self, board, screen, alpha, beta, depth, player):
+        self.tt = TranspositionTable(tt_size, tt_replacement)
+        self.ordering = ordering if ordering is not None else HeuristicOrdering()
+        self.radius = radius
+        self.pv = []
+        self.deadline = None
+        self.stop = None
+        self.trace = trace
+        self.on_trace = on_trace
+        self.on_iteration = on_iteration
+        self.reset_counters()
+
+    def negamax(self, board, alpha, beta, depth, player):
         """
-        Perform the Alpha-Beta pruning algorithm to find the best move.
+        Search a position with negamax alpha-beta and principal variation search.
+
+        Scores are from the point of view of the player to move. A won game
+        scores WIN_SCORE less the number of plies from the root to the win, so
+        the search prefers the quickest win and the slowest loss. The first move
+        of each node is searched with the full window and the rest with a null
+        window around alpha, which only proves them no better; a move that
+        turns out better is searched again with the full window.
+
+        Moves are made and undone in place on the one board passed in, which is
+        back in its original state when the search returns.
+
+        Results are cached in the transposition table by the canonical hash of the
+        position (shared by its rotations and reflections) and side to move. Only
+        one of each set of moves that a symmetry of the position makes equivalent
+        is searched. A cached bound deep enough for this node ends the search of it early,
+        except at the root. Moves are put in order by self.ordering, with the cached
+        best move first and the move the previous principal variation (self.pv)
+        played at this depth second. Moves that cause a cutoff are reported back to it.
+
+        If self.deadline is set and passes, or the self.stop event is set,
+        SearchAborted is raised, leaving the board with the moves of the
+        unfinished line still marked.
 
         Args:
             board (Board): The current game board.
-            screen (pygame.Surface): The screen to display the game.
-            alpha (float): The alpha value for pruning.
-            beta (float): The beta value for pruning.
+            alpha (float): The score the player to move is already sure of.
+            beta (float): The score the opponent is already sure of.
             depth (int): The current depth of the search.
-            player (str): The current player ('X' or 'O').
+            player (int): The player to move (1 or 2).
 
         Returns:
-            list: The best move and its evaluation score.
+            list: The best move and its score for the player to move.
         """
-        best_move = self.initialize_best_move(player)
-        available_cells = board.get_empty_sqrs()
+        self.nodes += 1
+        if not self.nodes & 255 and self.should_stop():
+            raise SearchAborted
 
-        if self.is_terminal(board, screen):
-            return self.terminal_score(board, screen)
+        if self.is_terminal(board):
+            return self.terminal_score(board, player, depth)
 
         if depth == self.max_depth:
-            return [-1, self.evaluate(board)]
-
+            self.leaf_evals += 1
+            score = self.evaluate(board)
+            return [-1, score if player == 1 else -score]
+
+        # Nothing below this node can win sooner than the next move or lose sooner than the one after.
+        if depth > 0:
+            alpha = max(alpha, depth - WIN_SCORE + 1)
+            beta = min(beta, WIN_SCORE - depth - 1)
+            if alpha >= beta:
+                return [-1, alpha]
+
+        key, sym = self.tt_key(board, player)
+        remaining = self.max_depth - depth
+        entry = self.tt_probe(board, key, sym)
+        tt_move = None
+        if entry is not None:
+            self.tt_hits += 1
+            _, entry_depth, entry_score, flag, tt_move, _ = entry
+            entry_score = score_from_tt(entry_score, depth)
+            if depth > 0 and entry_depth >= remaining and (
+                    flag == EXACT or
+                    (flag == LOWER and entry_score >= beta) or
+                    (flag == UPPER and entry_score <= alpha)):
+                self.tt_cutoffs += 1
+                return [tt_move, entry_score]
+        available_cells = self.ordered_moves(board, player, depth, tt_move)
+        opponent = 3 - player
+
+        alpha_orig = alpha
+        best_move = [-1, -float('inf')]
         for (row, col) in available_cells:
-            simulated_board = self.simulate(board, row, col, player)
-            score = self.alphabeta(simulated_board, screen, alpha, beta, depth + 1, self.switch(player))
-            score[0] = (row, col)
-
-            print(f"Depth: {depth}, Player: {player}, Move: {(row, col)}, Score: {score[1]}")  # Debug
-
-            best_move, alpha, beta = self.update_best_move(player, score, best_move, alpha, beta)
-            if beta <= alpha:
-                break
+            board.mark_sqr(row, col, player)
+            if best_move[0] == -1:
+                score = -self.negamax(board, -beta, -alpha, depth + 1, opponent)[1]
+            else:
+                score = -self.negamax(board, -alpha - 1, -alpha, depth + 1, opponent)[1]
+                if alpha < score < beta:
+                    self.researches += 1
+                    score = -self.negamax(board, -beta, -alpha, depth + 1, opponent)[1]
+            board.unmark_sqr(row, col)
+            if depth < self.trace:
+                self.report(depth, player, (row, col), score)
+
+            if score > best_move[1]:
+                best_move = [(row, col), score]
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        self.ordering.cutoff((row, col), player, depth, remaining)
+                        break
+
+        if best_move[1] <= alpha_orig:
+            flag = UPPER
+        elif best_move[1] >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt_store(board, key, sym, remaining, score_to_tt(best_move[1], depth), flag, best_move[0])
 
         return best_move
 
-    def initialize_best_move(self, player):
+    def reset_counters(self):
         """
-        Initialize the best move based on the player.
-
-        Args:
-            player (str): The current player ('X' or 'O').
+        Zero the search counters before a new move.
+        """
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.cutoffs = 0
+        self.researches = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+
+    def counters(self):
+        """
+        Get the search counters, to add to another search's with add_counters.
 
         Returns:
-            list: The initial best move and its evaluation score.
+            tuple: The nodes, leaf evaluations, cutoffs, re-searches, table hits and table cutoffs.
         """
-        return [-1, float("-inf")] if player == 'X' else [-1, float("inf")]
+        return self.nodes, self.leaf_evals, self.cutoffs, self.researches, self.tt_hits, self.tt_cutoffs
 
-    def is_terminal(self, board, screen):
+    def add_counters(self, counters):
         """
-        Check if the current board state is terminal.
+        Add the counters of a search done elsewhere, such as in a worker process.
 
         Args:
-            board (Board): The current game board.
-            screen (pygame.Surface): The screen to display the game.
+            counters (tuple): The counters, as returned by counters.
+        """
+        nodes, leaf_evals, cutoffs, researches, tt_hits, tt_cutoffs = counters
+        self.nodes += nodes
+        self.leaf_evals += leaf_evals
+        self.cutoffs += cutoffs
+        self.researches += researches
+        self.tt_hits += tt_hits
+        self.tt_cutoffs += tt_cutoffs
+
+    def report(self, depth, player, move, score):
+        """
+        Report a move scored within the traced plies.
+
+        Args:
+            depth (int): The depth of the node the move was made from.
+            player (int): The player who made it (1 or 2).
+            move (tuple): The move.
+            score (int): Its score for that player.
+        """
+        if self.on_trace is not None:
+            self.on_trace(depth, player, move, score)
+        else:
+            print(f"Depth: {depth}, Player: {player}, Move: {move}, Score: {score}")
+
+    def should_stop(self):
+        """
+        Check if the search has passed its deadline or been asked to stop.
 
         Returns:
-            bool: True if the board state is terminal, False otherwise.
+            bool: True if the search should be abandoned.
         """
-        return board.final_state(screen) in [1, 2] or board.isfull()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            return True
+        return self.stop is not None and self.stop.is_set()
 
-    def terminal_score(self, board, screen):
+    def tt_key(self, board, player):
         """
-        Get the terminal score for the current board state.
+        Get the transposition table key of a position.
 
         Args:
             board (Board): The current game board.
-            screen (pygame.Surface): The screen to display the game.
+            player (int): The player to move (1 or 2).
 
         Returns:
-            list: The terminal score.
+            tuple: The canonical position hash mixed with the side to move, and
+            the index of the symmetry that takes the board to its canonical orientation.
         """
-        state = board.final_state(screen)
-        return [-1, float('inf')] if state == 1 else [-1, float('-inf')] if state == 2 else [-1, 0]
+        key, sym = board.canonical_hash()
+        return (key if player == 1 else key ^ O_TO_MOVE), sym
 
-    def simulate(self, board, row, col, player):
+    def tt_probe(self, board, key, sym):
         """
-        Simulate a move on the board.
+        Look up a position in the transposition table.
+
+        Moves are stored as square indices in the canonical orientation, so the
+        move of the entry is turned back into a square of this board.
 
         Args:
             board (Board): The current game board.
-            row (int): The row of the move.
-            col (int): The column of the move.
-            player (str): The current player ('X' or 'O').
+            key (int): The key from tt_key.
+            sym (int): The symmetry from tt_key.
 
         Returns:
-            Board: The simulated board after the move.
+            tuple: The (key, depth, score, flag, move, generation) entry, or None if absent.
         """
-        simulated_board = copy.deepcopy(board)
-        simulated_board.mark_sqr(row, col, 1 if player == 'X' else 2)
-        return simulated_board
+        entry = self.tt.probe(key)
+        if entry is None or entry[4] == -1:
+            return entry
+        move = divmod(inverse_symmetries(board.size)[sym][entry[4]], board.size)
+        return entry[:4] + (move,) + entry[5:]
 
-    def switch(self, player):
+    def tt_store(self, board, key, sym, depth, score, flag, move):
         """
-        Switch the player.
+        Store a search result in the transposition table, with its move in the canonical orientation.
 
         Args:
-            player (str): The current player ('X' or 'O').
-
-        Returns:
-            str: The switched player.
+            board (Board): The current game board.
+            key (int): The key from tt_key.
+            sym (int): The symmetry from tt_key.
+            depth (int): The remaining depth the position was searched to.
+            score (int): The score found by the search, with win scores relative to the node (see score_to_tt).
+            flag (int): EXACT, LOWER or UPPER.
+            move (tuple): The best move found, or -1.
         """
-        return 'O' if player == 'X' else 'X'
+        if move != -1:
+            move = symmetries(board.size)[sym][move[0] * board.size + move[1]]
+        self.tt.store(key, depth, score, flag, move)
 
-    def update_best_move(self, player, score, best_move, alpha, beta):
+    def ordered_moves(self, board, player, depth, tt_move=None, unique=True):
         """
-        Update the best move based on the current score.
+        Get the legal moves of a node in the order the search tries them.
 
         Args:
-            player (str): The current player ('X' or 'O').
-            score (list): The current score.
-            best_move (list): The current best move.
-            alpha (float): The alpha value for pruning.
-            beta (float): The beta value for pruning.
+            board (Board): The current game board.
+            player (int): The player to move (1 or 2).
+            depth (int): The depth of the node from the root.
+            tt_move (tuple): The best move cached for the node, if any.
+            unique (bool): Whether to leave out moves equivalent by a symmetry of the position.
 
         Returns:
-            tuple: The updated best move, alpha, and beta values.
+            list: The empty squares (within self.radius of a mark, if set), best candidates first.
         """
-        if player == 'X':
-            if score[1] > best_move[1]:
-                best_move = score
-            alpha = max(alpha, score[1])
+        pv_move = self.pv[depth] if depth < len(self.pv) else None
+        first_moves = (tt_move, pv_move)
+        stabilizer = board.stabilizer() if unique else None
+        if stabilizer:
+            moves = board.unique_moves(stabilizer, self.radius)
+            first_moves = tuple(board.unique_move(*move, stabilizer) if isinstance(move, tuple) else move
+                                for move in first_moves)
+        elif self.radius is None:
+            moves = board.get_empty_sqrs()
         else:
-            if score[1] < best_move[1]:
-                best_move = score
-            beta = min(beta, score[1])
-        return best_move, alpha, beta
+            moves = board.get_nearby_sqrs(self.radius)
+        return self.ordering.order(board, moves, player, depth, first_moves)
 
-    def evaluate(self, board):
+    def iterative_deepening(self, board, player, time_budget_ms, parallel=None, stats=None, start=None):
         """
-        Evaluate the current board state.
+        Search one ply deeper at a time until the time budget runs out.
+
+        Each iteration searches the principal variation of the previous one first.
+        Deepening stops early once the game's result is proven, since no deeper
+        search can find a quicker win. The deadline does not apply to the first iteration, so a move is always
+        found unless the search is stopped through self.stop. Each completed
+        iteration is recorded in the stats and passed to self.on_iteration.
+
+        A result already known for the position, such as a position cache entry,
+        stands in for every iteration up to its depth: its move is the first
+        principal variation, deepening goes on from the next depth, and the
+        deadline applies from the start, as there is already a move to fall back on.
 
         Args:
             board (Board): The current game board.
+            player (int): The player to move (1 or 2).
+            time_budget_ms (float): The wall-clock time allowed for the search.
+            parallel (ParallelSearch): Searches each iteration's root moves across processes, if given.
+            stats (SearchStats): Where to record the iterations, if given.
+            start (tuple): The (depth, score, move) of a known result to deepen from, or None.
 
         Returns:
-            int: The evaluation score of the board.
+            list: The best move and its score from the deepest completed iteration.
         """
-        size = board.size
-        x_counts, o_counts = self.initialize_counts(size)
-
-        self.count_lines(board, size, x_counts, o_counts)
-        self.count_diagonals(board, size, x_counts, o_counts)
+        if stats is None:
+            stats = SearchStats()
+        deadline = time.perf_counter() + time_budget_ms / 1000
+        marked = len(board.moves)
+        self.pv = []
+        best_move = None
+        first = 1
+        if start is not None:
+            depth, score, move = start
+            best_move = [move, score]
+            self.pv = [move]
+            stats.add_iteration(depth, move, score, 0, 0.0)
+            if is_win_score(score):
+                return best_move
+            self.deadline = deadline
+            first = depth + 1
+        try:
+            for depth in range(first, len(board.get_empty_sqrs()) + 1):
+                self.max_depth = depth
+                start, nodes = time.perf_counter(), self.nodes
+                if parallel is None:
+                    best_move = self.negamax(board, -float('inf'), float('inf'), 0, player)
+                    self.pv = self.principal_variation(board, player, depth)
+                else:
+                    best_move = parallel.search(self, board, player)
+                stats.add_iteration(depth, best_move[0], best_move[1], self.nodes - nodes,
+                                    (time.perf_counter() - start) * 1000)
+                if self.on_iteration is not None:
+                    self.on_iteration(stats)
+                if is_win_score(best_move[1]) or time.perf_counter() > deadline:
+                    break
+                self.deadline = deadline
+        except SearchAborted:
+            while len(board.moves) > marked:
+                board.unmark_sqr(*board.last_move)
+            if best_move is None:
+                raise
+        finally:
+            self.deadline = None
+        return best_move
 
-        x_score = sum(4 * k * v for k, v in x_counts.items())
-        o_score = sum(4 * k * v for k, v in o_counts.items())
+    def principal_variation(self, board, player, length):
+        """
+        Follow the best moves stored in the transposition table from the current position.
 
-        return x_score - o_score
+        Args:
+            board (Board): The current game board.
+            player (int): The player to move (1 or 2).
+            length (int): The maximum number of moves to follow.
 
-    def initialize_counts(self, size):
+        Returns:
+            list: The moves of the principal variation.
         """
-        Initialize the counts for X and O.
+        pv = []
+        while len(pv) < length:
+            entry = self.tt_probe(board, *self.tt_key(board, player))
+            if entry is None or entry[4] == -1 or not board.empty_sqr(*entry[4]):
+                break
+            pv.append(entry[4])
+            board.mark_sqr(*entry[4], player)
+            player = 3 - player
+        for move in reversed(pv):
+            board.unmark_sqr(*move)
+        return pv
+
+    def is_terminal(self, board):
+        """
+        Check if the current board state is terminal.
 
         Args:
-            size (int): The size of the board.
+            board (Board): The current game board.
 
         Returns:
-            tuple: The initialized counts for X and O.
+            bool: True if somebody has won or the board is full.
         """
-        return dict.fromkeys(range(size + 1), 0), dict.fromkeys(range(size + 1), 0)
+        return bool(board.winner()) or board.isfull()
 
-    def count_lines(self, board, size, x_counts, o_counts):
+    def terminal_score(self, board, player, depth):
         """
-        Count the lines for X and O.
+        Get the score of a finished game for the player to move.
 
         Args:
             board (Board): The current game board.
-            size (int): The size of the board.
-            x_counts (dict): The counts for X.
-            o_counts (dict): The counts for O.
-        """
-        for row in range(size):
-            row_values = board.squares[row]
-            if 2 not in row_values:
-                x_counts[row_values.tolist().count(1)] += 1
-            if 1 not in row_values:
-                o_counts[row_values.tolist().count(2)] += 1
+            player (int): The player to move (1 or 2).
+            depth (int): The depth of the position from the root.
 
-        for col in range(size):
-            col_values = board.squares[:, col]
-            if 2 not in col_values:
-                x_counts[col_values.tolist().count(1)] += 1
-            if 1 not in col_values:
-                o_counts[col_values.tolist().count(2)] += 1
+        Returns:
+            list: No move and the score: WIN_SCORE - depth for a win, its negative for a loss, 0 for a draw.
+        """
+        winner = board.winner()
+        if not winner:
+            return [-1, 0]
+        return [-1, WIN_SCORE - depth if winner == player else depth - WIN_SCORE]
 
-    def count_diagonals(self, board, size, x_counts, o_counts):
+    def evaluate(self, board):
         """
-        Count the diagonals for X and O.
+        Evaluate the current board state.
+
+        Every row, column and diagonal that the opponent has not blocked is worth
+        4 points per mark in it. The board keeps this score up to date on every
+        move, so evaluating is a single read.
 
         Args:
             board (Board): The current game board.
-            size (int): The size of the board.
-            x_counts (dict): The counts for X.
-            o_counts (dict): The counts for O.
-        """
-        main_diag = [board.squares[i][i] for i in range(size)]
-        anti_diag = [board.squares[i][size - 1 - i] for i in range(size)]
-
-        if 2 not in main_diag:
-            x_counts[main_diag.count(1)] += 1
-        if 1 not in main_diag:
-            o_counts[main_diag.count(2)] += 1
 
-        if 2 not in anti_diag:
-            x_counts[anti_diag.count(1)] += 1
-        if 1 not in anti_diag:
-            o_counts[anti_diag.count(2)] += 1
+        Returns:
+            int: The evaluation score of the board, X's lines minus O's.
+        """
+        return board.line_score
 
 class AI:
-    def __init__(self, level=1, player=2, max_depth=4):
+    def __init__(self, level=1, player=2, max_depth=4, tt_size=1 << 16, tt_replacement='depth',
+                 time_budget_ms=None, ordering=None, workers=1, book=DEFAULT_BOOK, radius=2,
+                 engine='minimax', playouts=None, cache=None, endgame=10):
         """
         Initialize the AI with a specified level, player, and maximum depth.
 
@@ -228,27 +480,210 @@ class AI:
             level (int): The level of the AI.
             player (int): The player number (1 or 2).
             max_depth (int): The maximum depth for the MiniMax algorithm.
+            tt_size (int): The number of slots in the transposition table.
+            tt_replacement (str): The transposition table replacement policy, 'depth' or 'always'.
+            time_budget_ms (float): The default time allowed per move, or None for a fixed-depth search.
+            ordering (MoveOrdering): The move ordering stage, HeuristicOrdering by default.
+            workers (int): The number of processes to split the root moves across, 1 to search serially.
+            book (str): The opening book file to play from, if it exists; None to always search.
+            radius (int): On boards where the win length is shorter than the board, only
+                moves within this many squares of a mark are searched.
+            engine (str): 'minimax' for the alpha-beta search, 'mcts' for Monte Carlo Tree Search.
+            playouts (int): The playouts per move of the MCTS engine, on top of any time budget;
+                with neither, DEFAULT_PLAYOUTS.
+            cache (str): A persistent position cache file (see PositionCache) to answer
+                positions searched before, by this or any other process, and to store new results in.
+            endgame (int): Positions with fewer empty squares than this are solved
+                exactly by an EndgameSolver instead of searched; 0 to never solve.
         """
         self.level = level
         self.player = player
         self.max_depth = max_depth
-        self.minimax = MiniMax(max_depth)
-
-    def eval(self, main_board, screen):
+        self.time_budget_ms = time_budget_ms
+        self.radius = radius
+        self.minimax = MiniMax(max_depth, tt_size, tt_replacement, ordering)
+        self.geometry = None
+        self.parallel = None
+        if workers > 1:
+            # Imported here because the worker processes import this module.
+            from parallel import ParallelSearch
+            self.parallel = ParallelSearch(workers, tt_size, tt_replacement)
+        self.book = load_book(book)
+        self.last_stats = None
+        if engine not in ('minimax', 'mcts'):
+            raise ValueError(f"Unknown engine: {engine}")
+        self.playouts = playouts
+        self.mcts = None
+        if engine == 'mcts':
+            # Imported here because mcts.py imports this module.
+            from mcts import MCTS
+            self.mcts = MCTS()
+        self.endgame = endgame
+        self.solver = None
+        if endgame:
+            # Imported here because endgame.py imports this module.
+            from endgame import EndgameSolver
+            self.solver = EndgameSolver()
+        self.cache = None
+        if cache is not None:
+            # Imported here so that an AI without a cache does not load sqlite3.
+            from position_cache import PositionCache
+            self.cache = PositionCache(cache)
+
+    def eval(self, main_board, screen=None, time_budget_ms=None, return_stats=False):
         """
         Evaluate the best move for the AI.
 
+        Positions in the opening book are answered from it without searching.
+        Without a time budget, so are positions in the position cache that were
+        searched at least as deep as this search would go (max_depth, or 5 on a
+        3x3 board). A time-budgeted search takes a cached entry of any depth as
+        its deepest iteration so far and deepens from there, storing what it finds.
+        Positions with fewer than self.endgame empty squares are solved exactly,
+        never answered from the position cache, whose entries are only searched.
+        With a time budget the search deepens one ply at a time and returns the
+        best move of the deepest iteration that finished in time. Without one it
+        searches to max_depth (5 on a 3x3 board). The MCTS engine instead plays
+        out games until its time or playout budget runs out.
+
+        The statistics of the search are kept in self.last_stats.
+
         Args:
             main_board (Board): The current game board.
-            screen (pygame.Surface): The screen to display the game.
+            screen: Unused, as the search never draws; accepted for callers that pass the game screen.
+            time_budget_ms (float): The time allowed for this move, defaulting to self.time_budget_ms.
+            return_stats (bool): Whether to return the search statistics along with the move.
+
+        Returns:
+            tuple: The best move for the AI, or the move and its SearchStats if return_stats is set.
+        """
+        if time_budget_ms is None:
+            time_budget_ms = self.time_budget_ms
+        player = self.player
+        start = time.perf_counter()
+        stats = self.last_stats = SearchStats()
+        self.minimax.reset_counters()
+
+        board = self.search_board(main_board)
+        self.minimax.radius = self.radius if board.win_length < board.size else None
+        depth = 5 if main_board.size == 3 else self.max_depth
+        move = self.book.lookup(board, self.player) if self.book is not None else None
+        solve = self.solver is not None and board.size * board.size - board.marked_sqrs < self.endgame
+        cached = None
+        if move is None and self.cache is not None and self.mcts is None and not solve:
+            cached = self.cache.probe(board, self.player)
+            if cached is not None and time_budget_ms is None and cached[0] < depth:
+                cached = None
+        if move is not None:
+            self.minimax.pv = [move]
+            stats.book = True
+        elif cached is not None and time_budget_ms is None:
+            move = cached[2]
+            self.minimax.pv = [move]
+            stats.cache = True
+            stats.add_iteration(cached[0], move, cached[1], 0, 0.0)
+        elif solve:
+            move = self.solve_endgame(board, stats)
+        elif self.mcts is not None:
+            move = self.search_mcts(board, time_budget_ms, stats)
+        else:
+            if self.geometry != (board.size, board.win_length):
+                # Nothing learned under other rules carries over, not even move order.
+                self.minimax.tt.clear()
+                self.minimax.ordering.clear()
+                self.geometry = (board.size, board.win_length)
+            self.minimax.tt.new_search()
+            self.minimax.ordering.new_search()
+            if time_budget_ms is None:
+                self.minimax.max_depth = depth
+                self.minimax.pv = []
+                if self.parallel is None:
+                    move, evaluation = self.minimax.negamax(board, -float('inf'), float('inf'), 0, player)
+                else:
+                    move, evaluation = self.parallel.search(self.minimax, board, player)
+                stats.add_iteration(self.minimax.max_depth, move, evaluation, self.minimax.nodes,
+                                    (time.perf_counter() - start) * 1000)
+            else:
+                stats.cache = cached is not None
+                move, evaluation = self.minimax.iterative_deepening(board, player, time_budget_ms,
+                                                                    self.parallel, stats, cached)
+            if self.cache is not None:
+                self.cache.store(board, self.player, stats.depth, evaluation, move)
+        stats.collect(self.minimax, (time.perf_counter() - start) * 1000)
+        if stats.solved:
+            stats.nodes = self.solver.nodes
+        elif self.mcts is not None and not stats.book:
+            stats.nodes = self.mcts.playouts
+
+        return (move, stats) if return_stats else move
+
+    def solve_endgame(self, board, stats):
+        """
+        Find the best move with the exact endgame solver, using the stop event of self.minimax.
+
+        Args:
+            board (Board): The search's copy of the game board.
+            stats (SearchStats): Where to record the search; the score is the solver's, for the AI.
+
+        Returns:
+            tuple: The best move for the AI.
+        """
+        start = time.perf_counter()
+        self.solver.stop = self.minimax.stop
+        move, score = self.solver.solve(board, self.player)
+        self.minimax.pv = [move]
+        stats.solved = True
+        stats.add_iteration(board.size * board.size - board.marked_sqrs, move, score, self.solver.nodes,
+                            (time.perf_counter() - start) * 1000)
+        return move
+
+    def search_mcts(self, board, time_budget_ms, stats):
+        """
+        Find a move with the MCTS engine, using the radius and stop event of self.minimax.
+
+        Args:
+            board (Board): The search's copy of the game board.
+            time_budget_ms (float): The time allowed for this move, or None.
+            stats (SearchStats): Where to record the search.
 
         Returns:
             tuple: The best move for the AI.
         """
-        if main_board.size == 3:
-            self.minimax.max_depth = 5
+        start = time.perf_counter()
+        playouts = self.playouts
+        if playouts is None and time_budget_ms is None:
+            playouts = DEFAULT_PLAYOUTS
+        self.mcts.radius = self.minimax.radius
+        self.mcts.stop = self.minimax.stop
+        move, reward = self.mcts.search(board, self.player, time_budget_ms, playouts)
+        self.minimax.pv = [move]
+        stats.add_iteration(self.mcts.tree_depth, move, reward, self.mcts.playouts,
+                            (time.perf_counter() - start) * 1000)
+        return move
+
+    def close(self):
+        """
+        Shut down the worker processes of a parallel AI, unmap its opening book and close its position cache.
+        """
+        if self.parallel is not None:
+            self.parallel.close()
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def search_board(self, main_board):
+        """
+        Get a private bitboard copy of the game board for the search to work on.
 
-        move, evaluation = self.minimax.alphabeta(main_board, screen, -float('inf'), float('inf'), 0, 'X' if self.player == 1 else 'O')
+        Args:
+            main_board (Board): The current game board, or any object with a 2D `squares` grid.
 
-        print(f'AI has chosen to mark the square in pos {move} with an eval of: {evaluation}')
-        return move
\ No newline at end of file
+        Returns:
+            Board: A copy of the position backed by bitboards.
+        """
+        if isinstance(main_board, Board):
+            return main_board.copy()
+        return Board.from_squares(main_board.squares)
@@ -0,0 +1,185 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from ai import MiniMax
+from board import Board
+from ordering import HeuristicOrdering
+
+# Search depth per board size, chosen so each position takes well under a second.
+DEPTHS = {3: 9, 4: 7, 5: 6, 6: 5, 7: 5}
+# The fraction of the board filled in each game phase.
+PHASES = {'early': 0.1, 'mid': 0.35, 'late': 0.65}
+
+
+def make_position(size, phase):
+    """
+    Build the fixed benchmark position for a board size and game phase.
+
+    The position is a random game seeded by size and phase, replayed until it
+    reaches the phase's number of marks without anybody having won or being
+    able to win on the next move, so the same position comes out on every run.
+
+    Args:
+        size (int): The board size.
+        phase (str): 'early', 'mid' or 'late'.
+
+    Returns:
+        Board: The position, with X to move if the mark counts are equal.
+    """
+    marks = max(2, round(PHASES[phase] * size * size))
+    rng = random.Random(f'{size}-{phase}')
+    while True:
+        board = Board(size, 0)
+        while board.marked_sqrs < marks and not board.winner():
+            board.mark_sqr(*rng.choice(board.get_empty_sqrs()), 1 + board.marked_sqrs % 2)
+        player = 1 + board.marked_sqrs % 2
+        if not board.winner() and not HeuristicOrdering().threats(board, player):
+            return board
+
+
+def bench_search(board, depth, repeat):
+    """
+    Time a fixed-depth negamax search of a position, starting from a cold search each time.
+
+    Args:
+        board (Board): The position.
+        depth (int): The search depth.
+        repeat (int): The number of runs; the fastest one is reported.
+
+    Returns:
+        dict: The search counters, the time to move, nodes per second, and the chosen move and score.
+    """
+    player = 1 + board.marked_sqrs % 2
+    best = None
+    for _ in range(repeat):
+        minimax = MiniMax(max_depth=depth)
+        start = time.perf_counter()
+        move, score = minimax.negamax(board, -float('inf'), float('inf'), 0, player)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        'nodes': minimax.nodes,
+        'leaf_evals': minimax.leaf_evals,
+        'cutoffs': minimax.cutoffs,
+        'researches': minimax.researches,
+        'tt_hits': minimax.tt_hits,
+        'time_ms': round(best * 1000, 3),
+        'nodes_per_sec': round(minimax.nodes / best),
+        'move': list(move),
+        'score': score,
+    }
+
+
+def bench_evaluate(board, calls, repeat):
+    """
+    Time MiniMax.evaluate on a position.
+
+    Returns:
+        float: The time per call in nanoseconds, from the fastest of repeat runs.
+    """
+    evaluate = MiniMax().evaluate
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            evaluate(board)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return round(best / calls * 1e9, 1)
+
+
+def run(sizes, repeat=3, eval_calls=100000):
+    """
+    Benchmark every phase of every board size.
+
+    Args:
+        sizes (list): The board sizes.
+        repeat (int): The number of runs per search and per evaluate timing.
+        eval_calls (int): The number of evaluate calls to time per position.
+
+    Returns:
+        dict: The environment and one result per position.
+    """
+    results = []
+    for size in sizes:
+        for phase in PHASES:
+            board = make_position(size, phase)
+            result = bench_search(board, DEPTHS[size], repeat)
+            result['eval_ns'] = bench_evaluate(board, eval_calls, repeat)
+            results.append({'size': size, 'phase': phase, 'depth': DEPTHS[size], **result})
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+
+
+def compare(baseline, current, threshold):
+    """
+    Find the positions that got slower, or searched more nodes, than in a baseline run.
+
+    Args:
+        baseline (dict): A saved result of run.
+        current (dict): The new result of run.
+        threshold (float): The allowed relative slowdown, e.g. 0.1 for 10%.
+
+    Returns:
+        list: One message per regression; positions missing from the baseline are skipped.
+    """
+    saved = {(result['size'], result['phase']): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = saved.get((result['size'], result['phase']))
+        if old is None or old['depth'] != result['depth']:
+            continue
+        name = f"{result['size']}x{result['size']} {result['phase']}"
+        for field in ('time_ms', 'eval_ns', 'nodes'):
+            if result[field] > old[field] * (1 + threshold):
+                regressions.append(f"{name}: {field} {old[field]} -> {result[field]}")
+        if result['move'] != old['move']:
+            regressions.append(f"{name}: move {old['move']} -> {result['move']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the search on fixed positions.")
+    parser.add_argument('--sizes', type=int, nargs='*', default=sorted(DEPTHS), help="board sizes to benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per search, the fastest is reported")
+    parser.add_argument('--out', default='-', help="file for the JSON results, - for stdout")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON results of an earlier run to check against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slowdown against the baseline that counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+
+    Exits with status 1 if a comparison against a baseline finds regressions.
+    """
+    args = parse_args(argv)
+    current = run(args.sizes, args.repeat)
+    output = json.dumps(current, indent=2)
+    if args.out == '-':
+        print(output)
+    else:
+        with open(args.out, 'w') as out:
+            out.write(output + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), current, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,81 +1,479 @@
-import numpy as np
-import pygame
-from constants import *
+import functools
+import itertools
+import random
+import struct
+
+# Points per mark in a line that the opponent has not blocked.
+LINE_WEIGHT = 4
+
+# The hashes of a board's 8 symmetric orientations are packed into one integer, 64 bits each.
+HASH_BITS = 64
+PACKED_HASHES = struct.Struct('<8Q')
+
+
+@functools.lru_cache(maxsize=None)
+def win_lines(size, win_length=None):
+    """
+    Precompute the winning line masks for a board size and win length.
+
+    Square (row, col) is bit row * size + col. A line is every run of win_length
+    squares in a column, row, diagonal or anti-diagonal. Each entry is a
+    (kind, index, mask) tuple where kind is 'col', 'row', 'diag' or 'anti' and
+    index numbers the lines of that kind, in the order final_state checks them.
+    When win_length is the board size, the index of a column or row line is the
+    column or row itself.
+    """
+    k = win_length or size
+    span = range(size - k + 1)
+    lines = []
+    for col in range(size):
+        for start in span:
+            lines.append(('col', len(lines), sum(1 << ((start + i) * size + col) for i in range(k))))
+    rows = len(lines)
+    for row in range(size):
+        for start in span:
+            lines.append(('row', len(lines) - rows, sum(1 << (row * size + start + i) for i in range(k))))
+    for kind, step in (('diag', size + 1), ('anti', size - 1)):
+        first = len(lines)
+        for row in span:
+            for col in (span if kind == 'diag' else range(k - 1, size)):
+                lines.append((kind, len(lines) - first, sum(1 << (row * size + col + i * step) for i in range(k))))
+    return tuple(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def cell_lines(size, win_length=None):
+    """
+    Get the indices into win_lines(size, win_length) of the lines through each square.
+    """
+    lines = win_lines(size, win_length)
+    return tuple(tuple(i for i, (_, _, mask) in enumerate(lines) if mask >> idx & 1)
+                 for idx in range(size * size))
+
+
+@functools.lru_cache(maxsize=None)
+def column_masks(size):
+    """
+    Get the masks of all squares except the last column, and all except the first.
+
+    A bitboard is ANDed with these before shifting it one column right or left,
+    so that no mark wraps around to the next row.
+    """
+    first = sum(1 << (row * size) for row in range(size))
+    full = (1 << size * size) - 1
+    return full & ~(first << (size - 1)), full & ~first
+
+
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(size, win_length):
+    """
+    Get the Zobrist keys for a board size and win length, indexed as keys[player][row * size + col].
+
+    The keys come from a generator seeded with the board size and win length,
+    so hashes are reproducible across runs and processes, and the same marks
+    under different rules hash differently.
+    """
+    rng = random.Random(size << 8 | win_length)
+    return (None,) + tuple(tuple(rng.getrandbits(64) for _ in range(size * size)) for _ in (1, 2))
+
+
+@functools.lru_cache(maxsize=None)
+def symmetries(size):
+    """
+    Get the 8 symmetries of the square board (rotations and reflections) as square permutations.
+
+    Each symmetry is a tuple where entry row * size + col is the index that
+    square moves to. The first symmetry is the identity.
+    """
+    n = size - 1
+    transforms = (
+        lambda row, col: (row, col),
+        lambda row, col: (col, n - row),
+        lambda row, col: (n - row, n - col),
+        lambda row, col: (n - col, row),
+        lambda row, col: (row, n - col),
+        lambda row, col: (n - row, col),
+        lambda row, col: (col, row),
+        lambda row, col: (n - col, n - row),
+    )
+    return tuple(tuple(row * size + col for row, col in (transform(*divmod(idx, size)) for idx in range(size * size)))
+                 for transform in transforms)
+
+
+@functools.lru_cache(maxsize=None)
+def inverse_symmetries(size):
+    """
+    Get the inverse of each permutation in symmetries(size), in the same order.
+    """
+    return tuple(tuple(perm.index(idx) for idx in range(size * size)) for perm in symmetries(size))
+
+
+@functools.lru_cache(maxsize=None)
+def symmetric_zobrist(size, win_length):
+    """
+    Get the packed Zobrist keys of each square under every symmetry, indexed as keys[player][row * size + col].
+
+    Bits t * HASH_BITS and up of a key hold the Zobrist key of the square that
+    symmetry t moves the square to. XORing together the keys of every mark on a
+    board gives the hashes of all 8 transformed boards at once.
+    """
+    keys = zobrist_keys(size, win_length)
+    perms = symmetries(size)
+    return (None,) + tuple(tuple(sum(keys[player][perm[idx]] << (t * HASH_BITS) for t, perm in enumerate(perms))
+                                 for idx in range(size * size))
+                           for player in (1, 2))
+
+
+def permute_bits(bits, perm):
+    """
+    Move every set bit of a bitboard to where a square permutation sends it.
+    """
+    result = 0
+    while bits:
+        low = bits & -bits
+        result |= 1 << perm[low.bit_length() - 1]
+        bits ^= low
+    return result
+
 
 class Board:
-    def __init__(self, size, square_size):
+    def __init__(self, size, square_size=0, win_length=None):
         """
         Initialize the board with a given size and square size.
+
+        The square size is only kept for the game, which does all the drawing;
+        the board itself has no display code.
+
+        A player wins with win_length marks in a row, column or diagonal, by
+        default the whole size of the board.
+
+        Each player's marks are kept as one integer bitmask in self.bitboards,
+        indexed by player number (1 for X, 2 for O), and self.hash is the
+        Zobrist hash of the position. self.sym_hash packs the hashes of the
+        position transformed by each of the 8 symmetries(size), so those of all
+        its orientations are kept up to date with one XOR per move. self.line_counts[player][i] is how many
+        squares of line i the player holds, and self.wins[player] how many lines
+        the player has completed, so the winner is known without scanning the board.
+        self.threat_lines[player] is the set of lines the player could complete
+        with one more mark (win_length - 1 marks and none of the opponent's), so
+        threatened squares are found without scanning every line either.
+        self.line_score is the static evaluation from X's point of view: LINE_WEIGHT
+        per mark in every line the opponent has not blocked, X's lines minus O's.
         """
         self.size = size
         self.SQUARE_SIZE = square_size
-        self.squares = np.zeros((size, size))
+        self.win_length = win_length or size
+        self.lines = win_lines(size, self.win_length)
+        self.cell_lines = cell_lines(size, self.win_length)
+        self.full_mask = (1 << size * size) - 1
+        self.zobrist = zobrist_keys(size, self.win_length)
+        self.bitboards = [0, 0, 0]
+        self.hash = 0
+        self.sym_zobrist = symmetric_zobrist(size, self.win_length)
+        self.sym_hash = 0
+        self.line_counts = [None, [0] * len(self.lines), [0] * len(self.lines)]
+        self.wins = [0, 0, 0]
+        self.threat_lines = [None, set(), set()]
+        self.line_score = 0
+        self.moves = []
         self.marked_sqrs = 0
 
-    def final_state(self, screen, show=False):
+    @classmethod
+    def from_squares(cls, squares, square_size=0, win_length=None):
         """
-        Check the final state of the board.
+        Build a board from a 2D grid of 0 (empty), 1 (X) and 2 (O).
+        """
+        board = cls(len(squares), square_size, win_length)
+        for row, values in enumerate(squares):
+            for col, player in enumerate(values):
+                if player:
+                    board.mark_sqr(row, col, int(player))
+        return board
+
+    def copy(self):
+        """
+        Return an independent copy of the board.
+        """
+        board = Board(self.size, self.SQUARE_SIZE, self.win_length)
+        board.bitboards = self.bitboards[:]
+        board.hash = self.hash
+        board.sym_hash = self.sym_hash
+        board.line_counts = [None, self.line_counts[1][:], self.line_counts[2][:]]
+        board.wins = self.wins[:]
+        board.threat_lines = [None, set(self.threat_lines[1]), set(self.threat_lines[2])]
+        board.line_score = self.line_score
+        board.moves = self.moves[:]
+        board.marked_sqrs = self.marked_sqrs
+        return board
+
+    @property
+    def squares(self):
+        """
+        The board as a 2D NumPy array of 0 (empty), 1 (X) and 2 (O).
+
+        The array is built from the bitboards on every access, so it is a read-only snapshot.
+        """
+        # Imported here so that the rules and search start without loading NumPy.
+        import numpy as np
+
+        squares = np.zeros((self.size, self.size))
+        for player in (1, 2):
+            bits = self.bitboards[player]
+            while bits:
+                low = bits & -bits
+                squares[divmod(low.bit_length() - 1, self.size)] = player
+                bits ^= low
+        return squares
+
+    @property
+    def last_move(self):
+        """
+        The most recently marked square, or None on an empty board.
+        """
+        return self.moves[-1] if self.moves else None
+
+    def canonical(self):
+        """
+        Get the position in its canonical orientation, shared by all its rotations and reflections.
+
+        The key packs X's bitboard in the low size * size bits and O's above
+        them, and the canonical orientation is the one with the smallest key.
+
+        Returns:
+            tuple: The canonical key and the symmetry (a permutation from symmetries)
+            that takes this board to it.
         """
-        for col in range(self.size):
-            if all(self.squares[row][col] == self.squares[0][col] != 0 for row in range(self.size)):
-                if show:
-                    color = CIRC_COLOR if self.squares[0][col] == 2 else CROSS_COLOR
-                    iPos = (col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2, 20)
-                    fPos = (col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2, HEIGHT - 20)
-                    pygame.draw.line(screen, color, iPos, fPos, LINE_WIDTH)
-                return self.squares[0][col]
-
-        for row in range(self.size):
-            if all(self.squares[row][col] == self.squares[row][0] != 0 for col in range(self.size)):
-                if show:
-                    color = CIRC_COLOR if self.squares[row][0] == 2 else CROSS_COLOR
-                    iPos = (20, row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2)
-                    fPos = (WIDTH - 20, row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2)
-                    pygame.draw.line(screen, color, iPos, fPos, LINE_WIDTH)
-                return self.squares[row][0]
-
-        if all(self.squares[i][i] == self.squares[0][0] != 0 for i in range(self.size)):
-            if show:
-                color = CIRC_COLOR if self.squares[0][0] == 2 else CROSS_COLOR
-                iPos = (20, 20)
-                fPos = (WIDTH - 20, HEIGHT - 20)
-                pygame.draw.line(screen, color, iPos, fPos, CROSS_WIDTH)
-            return self.squares[0][0]
-
-        if all(self.squares[i][self.size - 1 - i] == self.squares[0][self.size - 1] != 0 for i in range(self.size)):
-            if show:
-                color = CIRC_COLOR if self.squares[0][self.size - 1] == 2 else CROSS_COLOR
-                iPos = (20, HEIGHT - 20)
-                fPos = (WIDTH - 20, 20)
-                pygame.draw.line(screen, color, iPos, fPos, CROSS_WIDTH)
-            return self.squares[0][self.size - 1]
+        shift = self.size * self.size
+        best = None
+        for perm in symmetries(self.size):
+            key = permute_bits(self.bitboards[1], perm) | permute_bits(self.bitboards[2], perm) << shift
+            if best is None or key < best[0]:
+                best = (key, perm)
+        return best
 
+    @property
+    def sym_hashes(self):
+        """
+        The hashes of the position transformed by each of the 8 symmetries(size), in order.
+        """
+        return PACKED_HASHES.unpack(self.sym_hash.to_bytes(PACKED_HASHES.size, 'little'))
+
+    def canonical_hash(self):
+        """
+        Get the smallest of the hashes of the position's 8 orientations.
+
+        Returns:
+            tuple: The hash, shared by every rotation and reflection of the
+            position, and the index in symmetries(size) of the symmetry that gives it.
+        """
+        hashes = self.sym_hashes
+        key = min(hashes)
+        return key, hashes.index(key)
+
+    def stabilizer(self):
+        """
+        Get the symmetries that leave the position unchanged, other than the identity.
+
+        Returns:
+            list: Their square permutations, from symmetries(size).
+        """
+        hashes = self.sym_hashes
+        if hashes.count(self.hash) == 1:
+            return []
+        perms = symmetries(self.size)
+        return [perms[t] for t in range(1, 8) if hashes[t] == self.hash]
+
+    def unique_moves(self, stabilizer=None, radius=None):
+        """
+        Get the empty squares, leaving out those equivalent to another by a symmetry of the position.
+
+        Of each set of equivalent squares only the one with the lowest index is
+        kept, so every move that leads to a different position appears once.
+
+        Args:
+            stabilizer (list): The result of self.stabilizer(), if already known.
+            radius (int): Only include squares this close to a mark (see get_nearby_sqrs), if given.
+        """
+        moves = self.get_empty_sqrs() if radius is None else self.get_nearby_sqrs(radius)
+        if stabilizer is None:
+            stabilizer = self.stabilizer()
+        if not stabilizer:
+            return moves
+        size = self.size
+        return [(row, col) for row, col in moves
+                if all(perm[row * size + col] >= row * size + col for perm in stabilizer)]
+
+    def unique_move(self, row, col, stabilizer=None):
+        """
+        Get the square that unique_moves keeps in place of a square equivalent to it.
+
+        Args:
+            row (int): The row of the square.
+            col (int): The column of the square.
+            stabilizer (list): The result of self.stabilizer(), if already known.
+        """
+        if stabilizer is None:
+            stabilizer = self.stabilizer()
+        idx = row * self.size + col
+        return divmod(min([idx] + [perm[idx] for perm in stabilizer]), self.size)
+
+    def winner(self):
+        """
+        Get the player who has completed a line, or 0 if nobody has.
+        """
+        if self.wins[1]:
+            return 1
+        if self.wins[2]:
+            return 2
         return 0
 
+    def final_state(self):
+        """
+        Check the final state of the board.
+
+        Returns:
+            int: The winner (1 or 2), or 0 if nobody has won.
+        """
+        return self.winner()
+
+    def threat_squares(self, player):
+        """
+        Get the empty squares that would complete a line for a player, from self.threat_lines.
+
+        Returns:
+            list: The squares as (row, col), by line index; a square on several lines is listed once per line.
+        """
+        own_bits = self.bitboards[player]
+        return [divmod((self.lines[line][2] & ~own_bits).bit_length() - 1, self.size)
+                for line in sorted(self.threat_lines[player])]
+
+    def winning_line(self):
+        """
+        Get the (kind, index, mask) entry of a completed line, or None if there is none.
+
+        The lines through the last move are checked first, since that is where a new win appears.
+        """
+        player = self.winner()
+        if not player:
+            return None
+        counts = self.line_counts[player]
+        last = self.last_move
+        candidates = self.cell_lines[last[0] * self.size + last[1]] if last else ()
+        for line in itertools.chain(candidates, range(len(self.lines))):
+            if counts[line] == self.win_length:
+                return self.lines[line]
+
     def mark_sqr(self, row, col, player):
         """
         Mark a square with the player's move.
         """
-        self.squares[row][col] = player
+        idx = row * self.size + col
+        self.bitboards[player] |= 1 << idx
+        self.hash ^= self.zobrist[player][idx]
+        self.sym_hash ^= self.sym_zobrist[player][idx]
+        counts = self.line_counts[player]
+        other = self.line_counts[3 - player]
+        threat = self.win_length - 1
+        gain = 0
+        for line in self.cell_lines[idx]:
+            if not other[line]:
+                gain += 1
+                count = counts[line] = counts[line] + 1
+                if count == threat:
+                    self.threat_lines[player].add(line)
+                elif count == self.win_length:
+                    self.wins[player] += 1
+                    self.threat_lines[player].discard(line)
+            else:
+                if not counts[line]:
+                    gain += other[line]
+                    if other[line] == threat:
+                        self.threat_lines[3 - player].discard(line)
+                counts[line] += 1
+        self.line_score += LINE_WEIGHT * gain if player == 1 else -LINE_WEIGHT * gain
+        self.moves.append((row, col))
         self.marked_sqrs += 1
 
+    def unmark_sqr(self, row, col):
+        """
+        Clear a marked square, undoing mark_sqr.
+        """
+        idx = row * self.size + col
+        bit = 1 << idx
+        player = 1 if self.bitboards[1] & bit else 2
+        self.bitboards[player] ^= bit
+        self.hash ^= self.zobrist[player][idx]
+        self.sym_hash ^= self.sym_zobrist[player][idx]
+        counts = self.line_counts[player]
+        other = self.line_counts[3 - player]
+        threat = self.win_length - 1
+        gain = 0
+        for line in self.cell_lines[idx]:
+            count = counts[line]
+            counts[line] = count - 1
+            if not other[line]:
+                gain += 1
+                if count == self.win_length:
+                    self.wins[player] -= 1
+                    self.threat_lines[player].add(line)
+                elif count == threat:
+                    self.threat_lines[player].discard(line)
+            elif count == 1:
+                gain += other[line]
+                if other[line] == threat:
+                    self.threat_lines[3 - player].add(line)
+        self.line_score -= LINE_WEIGHT * gain if player == 1 else -LINE_WEIGHT * gain
+        if self.moves[-1] == (row, col):
+            self.moves.pop()
+        else:
+            self.moves.remove((row, col))
+        self.marked_sqrs -= 1
+
     def empty_sqr(self, row, col):
         """
         Check if a square is empty.
         """
-        return self.squares[row][col] == 0
+        return not ((self.bitboards[1] | self.bitboards[2]) >> (row * self.size + col)) & 1
 
     def get_empty_sqrs(self):
         """
         Get a list of empty squares.
         """
+        empty = self.full_mask & ~(self.bitboards[1] | self.bitboards[2])
         empty_sqrs = []
-        for row in range(self.size):
-            for col in range(self.size):
-                if self.empty_sqr(row, col):
-                    empty_sqrs.append((row, col))
+        while empty:
+            low = empty & -empty
+            empty_sqrs.append(divmod(low.bit_length() - 1, self.size))
+            empty ^= low
         return empty_sqrs
 
+    def get_nearby_sqrs(self, radius):
+        """
+        Get the empty squares within a radius of any mark, in row-major order.
+
+        A square is within the radius if it is at most radius rows and radius
+        columns away from a mark. On an empty board the centre square is returned.
+
+        Args:
+            radius (int): The largest distance from a mark.
+        """
+        occupied = self.bitboards[1] | self.bitboards[2]
+        if not occupied:
+            return [(self.size // 2, self.size // 2)]
+        keep_right, keep_left = column_masks(self.size)
+        near = occupied
+        for _ in range(radius):
+            near |= (near & keep_right) << 1 | (near & keep_left) >> 1
+        for _ in range(radius):
+            near |= near << self.size | near >> self.size
+        near &= self.full_mask & ~occupied
+        squares = []
+        while near:
+            low = near & -near
+            squares.append(divmod(low.bit_length() - 1, self.size))
+            near ^= low
+        return squares
+
     def isfull(self):
         """
         Check if the board is full.
@@ -86,4 +484,4 @@ class Board:
         """
         Check if the board is empty.
         """
-        return self.marked_sqrs == 0
\ No newline at end of file
+        return self.marked_sqrs == 0
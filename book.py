@@ -0,0 +1,140 @@
+import mmap
+import os
+import struct
+
+# The book file starts with a header of magic, version and record count,
+# followed by the records sorted by key.
+MAGIC = b'TTTB'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+# Each record is the position key, the move in the canonical orientation,
+# the flags and the score for the side to move.
+RECORD = struct.Struct('<QBBh')
+KEY = struct.Struct('<Q')
+
+# Set when the score is the exact game result rather than a search evaluation.
+FLAG_EXACT = 1
+
+# The largest board a book covers: a record key holds the size in its top 8 bits
+# and X's and O's bitboards, 2 * size * size bits, in the 56 below.
+MAX_SIZE = 5
+
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+
+
+def book_key(size, canonical_key):
+    """
+    Get the record key of a position from its size and canonical key (see Board.canonical).
+
+    Raises:
+        ValueError: If the board is larger than MAX_SIZE, so the key would not fit a record.
+    """
+    if size > MAX_SIZE:
+        raise ValueError(f"Opening books only cover boards up to {MAX_SIZE}x{MAX_SIZE}, not {size}x{size}")
+    return size << 56 | canonical_key
+
+
+def write_book(path, records):
+    """
+    Write a book file.
+
+    Args:
+        path (str): The file to write.
+        records (dict): Maps each record key to its (move, flags, score) tuple,
+            where move is a square index in the canonical orientation.
+    """
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        for key in sorted(records):
+            out.write(RECORD.pack(key, *records[key]))
+
+
+def load_book(path):
+    """
+    Open a book file if it exists.
+
+    Returns:
+        OpeningBook: The book, or None if there is no file at path.
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        """
+        Memory-map a book file written by write_book.
+
+        The records stay on disk and are binary searched in place, so opening
+        a book costs nothing however large it is.
+
+        Args:
+            path (str): The book file.
+
+        Raises:
+            ValueError: If the file is not a book of this version.
+        """
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {VERSION} book file")
+
+    def probe(self, key):
+        """
+        Find the record of a key.
+
+        Args:
+            key (int): The record key, from book_key.
+
+        Returns:
+            tuple: The (move, flags, score) of the record, or None if the key is not in the book.
+        """
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if KEY.unpack_from(self.data, HEADER.size + mid * RECORD.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.count:
+            record = RECORD.unpack_from(self.data, HEADER.size + low * RECORD.size)
+            if record[0] == key:
+                return record[1:]
+        return None
+
+    def lookup(self, board, player):
+        """
+        Get the book move for a position.
+
+        The book assumes X moved first and a win takes a full line, so it is
+        only consulted when the counts of marks on the board agree with player
+        being the one to move and the board's win length is its size. Boards
+        larger than MAX_SIZE are never in a book.
+
+        Args:
+            board (Board): The current game board.
+            player (int): The player to move (1 or 2).
+
+        Returns:
+            tuple: The book move as (row, col), or None if the position is not in the book.
+        """
+        if board.win_length != board.size or board.size > MAX_SIZE:
+            return None
+        x_count = bin(board.bitboards[1]).count('1')
+        o_count = bin(board.bitboards[2]).count('1')
+        if x_count - o_count != (0 if player == 1 else 1):
+            return None
+        key, perm = board.canonical()
+        record = self.probe(book_key(board.size, key))
+        if record is None:
+            return None
+        return divmod(perm.index(record[0]), board.size)
+
+    def close(self):
+        """
+        Unmap the book file.
+        """
+        self.data.close()
@@ -0,0 +1,138 @@
+import argparse
+import sys
+import time
+from ai import MiniMax
+from board import Board
+from book import DEFAULT_BOOK, FLAG_EXACT, MAX_SIZE, book_key, write_book
+
+# Score of a win at ply 0; a win after more moves scores less, so the solver prefers quick wins.
+WIN = 100
+SCORE_LIMIT = 2 ** 15 - 1
+
+
+def solve(board, player, records):
+    """
+    Solve a position exactly, recording the best move of every position reached.
+
+    A win ending the game after ply moves scores WIN - ply for the winner and
+    the negation for the loser, so the best move wins soonest or loses latest.
+    Positions are recorded once per symmetry class.
+
+    Args:
+        board (Board): The position to solve.
+        player (int): The player to move (1 or 2).
+        records (dict): The book records found so far, by record key.
+
+    Returns:
+        int: The exact score for the player to move.
+    """
+    key, perm = board.canonical()
+    record_key = book_key(board.size, key)
+    if record_key in records:
+        return records[record_key][2]
+
+    best_score, best_move = None, None
+    for row, col in board.get_empty_sqrs():
+        board.mark_sqr(row, col, player)
+        if board.winner():
+            score = WIN - board.marked_sqrs
+        elif board.isfull():
+            score = 0
+        else:
+            score = -solve(board, 3 - player, records)
+        board.unmark_sqr(row, col)
+        if best_score is None or score > best_score:
+            best_score, best_move = score, (row, col)
+
+    records[record_key] = (perm[best_move[0] * board.size + best_move[1]], FLAG_EXACT, best_score)
+    return best_score
+
+
+def opening_positions(size, plies):
+    """
+    List one board of every symmetry class reachable in at most the given number of plies.
+
+    Positions where the game is already over are left out.
+
+    Args:
+        size (int): The board size.
+        plies (int): The number of moves to play out from the empty board, X first.
+
+    Yields:
+        Board: The positions, shallowest first.
+    """
+    seen = set()
+    level = [Board(size, 0)]
+    for ply in range(plies + 1):
+        following = []
+        for board in level:
+            key = board.canonical()[0]
+            if key in seen or board.winner() or board.isfull():
+                continue
+            seen.add(key)
+            yield board
+            if ply < plies:
+                for row, col in board.get_empty_sqrs():
+                    child = board.copy()
+                    child.mark_sqr(row, col, 1 if ply % 2 == 0 else 2)
+                    following.append(child)
+        level = following
+
+
+def search_openings(size, plies, depth, records):
+    """
+    Search every opening position to a fixed depth and record the best moves.
+
+    Args:
+        size (int): The board size.
+        plies (int): How many moves deep the book goes.
+        depth (int): The search depth per position.
+        records (dict): The book records found so far, by record key.
+    """
+    minimax = MiniMax(max_depth=depth)
+    for board in opening_positions(size, plies):
+        player = 1 + board.marked_sqrs % 2
+        minimax.tt.new_search()
+        minimax.ordering.new_search()
+        minimax.pv = []
+        (row, col), score = minimax.negamax(board, -float('inf'), float('inf'), 0, player)
+        score = max(-SCORE_LIMIT, min(SCORE_LIMIT, score))
+        key, perm = board.canonical()
+        records[book_key(size, key)] = (perm[row * size + col], 0, int(score))
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line.
+    """
+    parser = argparse.ArgumentParser(description="Build the AI's opening book.")
+    parser.add_argument('--out', default=DEFAULT_BOOK, help="book file to write")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[4, 5],
+                        help=f"board sizes up to {MAX_SIZE} to build an opening book for; 3x3 is always solved completely")
+    parser.add_argument('--plies', type=int, default=3, help="how many moves deep the opening book goes")
+    parser.add_argument('--depth', type=int, default=5, help="search depth per opening position")
+    args = parser.parse_args(argv)
+    if any(size > MAX_SIZE for size in args.sizes):
+        parser.error(f"--sizes: book records only fit boards up to {MAX_SIZE}x{MAX_SIZE}")
+    return args
+
+
+def main(argv=None):
+    """
+    Build the book from the command line.
+    """
+    args = parse_args(argv)
+    records = {}
+    start = time.perf_counter()
+    solve(Board(3, 0), 1, records)
+    print(f"3x3: {len(records)} positions solved", file=sys.stderr)
+    for size in args.sizes:
+        before = len(records)
+        search_openings(size, args.plies, args.depth, records)
+        print(f"{size}x{size}: {len(records) - before} positions searched", file=sys.stderr)
+    write_book(args.out, records)
+    print(f"Wrote {len(records)} positions to {args.out} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,4 +10,16 @@ LINE_WIDTH = 15
 CROSS_WIDTH = 25
 CIRC_WIDTH = 15
 
-OFFSET = 50
\ No newline at end of file
+OFFSET = 50
+
+# The most frames per second the window is redrawn; it sleeps between events.
+FPS = 60
+
+# Wall-clock time the AI may think per move, in milliseconds.
+AI_TIME_BUDGET_MS = 1000
+
+# Marks in a row needed to win; smaller boards need a full row.
+WIN_LENGTH = 5
+
+# File of the persistent position cache shared by games and processes, or None for no cache.
+POSITION_CACHE = None
@@ -0,0 +1,169 @@
+from ai import SearchAborted
+from transposition import EXACT, LOWER, UPPER, O_TO_MOVE
+
+
+class EndgameSolver:
+    def __init__(self, max_entries=1 << 20):
+        """
+        Initialize an exact solver for positions with few empty squares.
+
+        The solver searches every line to the end of the game with alpha-beta
+        and no evaluation function. A position scores 0 for a draw and, for a
+        win, 1 plus the number of squares still empty after the winning move,
+        negated for a loss, so quicker wins and slower losses score higher.
+        Results are cached by canonical hash and side to move across calls,
+        since a position's score does not depend on how it was reached; they
+        are dropped when the board size or win length changes.
+
+        Args:
+            max_entries (int): The cache is cleared when it grows past this many positions.
+        """
+        self.max_entries = max_entries
+        self.cache = {}
+        self.geometry = None
+        self.nodes = 0
+        self.stop = None
+
+    def solve(self, board, player):
+        """
+        Find the best move of a position and its exact score.
+
+        Args:
+            board (Board): The current game board, which is back in its original state on return.
+            player (int): The player to move (1 or 2).
+
+        Returns:
+            tuple: The best move as (row, col) and its score for player (see __init__).
+
+        Raises:
+            SearchAborted: If the self.stop event is set.
+        """
+        self.nodes = 0
+        if len(self.cache) > self.max_entries or self.geometry != (board.size, board.win_length):
+            self.cache.clear()
+            self.geometry = (board.size, board.win_length)
+        best_move, best_score = None, -float('inf')
+        for idx in self.candidates(board, player, self.empty_squares(board)):
+            row, col = divmod(idx, board.size)
+            board.mark_sqr(row, col, player)
+            score = self.score_after_move(board, player, best_score, float('inf'))
+            board.unmark_sqr(row, col)
+            if score > best_score:
+                best_move, best_score = (row, col), score
+        return best_move, best_score
+
+    def score_after_move(self, board, player, alpha, beta):
+        """
+        Score the position just after player moved, for player.
+        """
+        if board.wins[player]:
+            return 1 + self.empty_count(board)
+        if self.empty_count(board) == 0:
+            return 0
+        return -self.negamax(board, 3 - player, -beta, -alpha)
+
+    def negamax(self, board, player, alpha, beta):
+        """
+        Score a position for the player to move, within an alpha-beta window.
+
+        Args:
+            board (Board): The position, with no winner and at least one empty square.
+            player (int): The player to move (1 or 2).
+            alpha (float): The score player is already sure of.
+            beta (float): The score the opponent is already sure of.
+
+        Returns:
+            int: The score, exact if it lies inside the window and a bound otherwise.
+        """
+        self.nodes += 1
+        if not self.nodes & 1023 and self.stop is not None and self.stop.is_set():
+            raise SearchAborted
+        squares = self.empty_squares(board)
+        empty = len(squares)
+        if self.winning_squares(board, player, squares, 1):
+            return empty
+
+        key = board.canonical_hash()[0] ^ (O_TO_MOVE if player == 2 else 0)
+        entry = self.cache.get(key)
+        if entry is not None:
+            flag, score = entry
+            if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                return score
+
+        blocks = self.winning_squares(board, 3 - player, squares, 2)
+        if len(blocks) > 1:
+            # Whatever player does, the opponent completes a line on the next move.
+            return -(empty - 1)
+        moves = blocks or self.candidates(board, player, squares)
+
+        alpha_orig = alpha
+        best = -float('inf')
+        for idx in moves:
+            row, col = divmod(idx, board.size)
+            board.mark_sqr(row, col, player)
+            score = 0 if empty == 1 else -self.negamax(board, 3 - player, -beta, -alpha)
+            board.unmark_sqr(row, col)
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        flag = UPPER if best <= alpha_orig else LOWER if best >= beta else EXACT
+        self.cache[key] = (flag, best)
+        return best
+
+    def candidates(self, board, player, squares):
+        """
+        Order the empty squares (indices) with the player's winning squares first.
+        """
+        wins = self.winning_squares(board, player, squares)
+        return wins + [idx for idx in squares if idx not in wins]
+
+    def winning_squares(self, board, player, squares, limit=None):
+        """
+        Find the empty squares that complete a line for a player.
+
+        Only the lines through the empty squares are checked, which is cheap
+        when few squares are empty, whatever the size of the board.
+
+        Args:
+            board (Board): The current game board.
+            player (int): The player (1 or 2).
+            squares (list): The empty squares as indices (see empty_squares).
+            limit (int): Stop after finding this many squares, or None to find all.
+
+        Returns:
+            list: The winning squares as indices.
+        """
+        counts = board.line_counts[player]
+        other = board.line_counts[3 - player]
+        needed = board.win_length - 1
+        wins = []
+        for idx in squares:
+            for line in board.cell_lines[idx]:
+                if counts[line] == needed and not other[line]:
+                    wins.append(idx)
+                    if len(wins) == limit:
+                        return wins
+                    break
+        return wins
+
+    def empty_squares(self, board):
+        """
+        Get the indices of the empty squares, in increasing order.
+        """
+        bits = board.full_mask & ~(board.bitboards[1] | board.bitboards[2])
+        squares = []
+        while bits:
+            low = bits & -bits
+            squares.append(low.bit_length() - 1)
+            bits ^= low
+        return squares
+
+    def empty_count(self, board):
+        """
+        Get the number of empty squares.
+        """
+        return board.size * board.size - board.marked_sqrs
@@ -1,78 +1,128 @@
+import functools
 import pygame
 from board import Board
 from ai import AI
 from constants import *
 
+
+def cross_positions(square_size):
+    """
+    Calculate the start and end points of the two strokes of a cross in a square at the origin.
+    """
+    offset = square_size // 4
+    far = square_size - offset
+    return [((offset, offset), (far, far)), ((offset, far), (far, offset))]
+
+
+def prepare(surface):
+    """
+    Convert a surface to the display's pixel format, once there is a display, so it blits faster.
+    """
+    return surface.convert_alpha() if pygame.display.get_surface() is not None else surface
+
+
+@functools.lru_cache(maxsize=None)
+def figure_surface(player, square_size):
+    """
+    Render a figure once per square size.
+
+    Args:
+        player (int): 1 for a cross (X), 2 for a circle (O).
+        square_size (int): The size of a board square in pixels.
+
+    Returns:
+        pygame.Surface: A transparent square_size x square_size surface with the figure in its middle.
+    """
+    surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+    if player == 1:
+        for start, end in cross_positions(square_size):
+            pygame.draw.line(surface, CROSS_COLOR, start, end, square_size // 5)
+    else:
+        center = (square_size // 2, square_size // 2)
+        pygame.draw.circle(surface, CIRC_COLOR, center, square_size // 3, square_size // 10)
+    return prepare(surface)
+
+
+@functools.lru_cache(maxsize=None)
+def grid_surface(size, square_size):
+    """
+    Render the empty board, background and grid lines, once per board size.
+
+    Returns:
+        pygame.Surface: A WIDTH x HEIGHT surface of the empty board.
+    """
+    surface = pygame.Surface((WIDTH, HEIGHT))
+    surface.fill(BG_COLOR)
+    for i in range(1, size):
+        pygame.draw.line(surface, LINE_COLOR, (i * square_size, 0), (i * square_size, HEIGHT), LINE_WIDTH)
+        pygame.draw.line(surface, LINE_COLOR, (0, i * square_size), (WIDTH, i * square_size), LINE_WIDTH)
+    return surface.convert() if pygame.display.get_surface() is not None else surface
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(font_size):
+    """
+    Load the default font at a size, once per size.
+    """
+    return pygame.font.Font(None, font_size)
+
+
+@functools.lru_cache(maxsize=256)
+def text_surface(text, font_size, color=(255, 255, 255)):
+    """
+    Render a line of text, once per text, size and color.
+
+    Returns:
+        pygame.Surface: The rendered text.
+    """
+    return get_font(font_size).render(text, True, color)
+
+
 class Game:
-    def __init__(self, size, screen):
+    def __init__(self, size, screen, ai=None):
         """
         Initialize the game with board size and screen.
+
+        A new AI is created unless one is given, such as the AI of the previous game.
         """
         self.size = size
         self.screen = screen
         self.SQUARE_SIZE = WIDTH // size
-        self.board = Board(size, self.SQUARE_SIZE)
-        self.ai = AI()
+        self.board = Board(size, self.SQUARE_SIZE, min(size, WIN_LENGTH))
+        self.ai = ai or AI(time_budget_ms=AI_TIME_BUDGET_MS, cache=POSITION_CACHE)
         self.player = 1
         self.gamemode = 'ai'
         self.running = True
-        self.CIRCLE_RADIUS = self.SQUARE_SIZE // 3
-        self.CROSS_WIDTH = self.SQUARE_SIZE // 5  
-        self.CIRC_WIDTH = self.SQUARE_SIZE // 10  
-        self.OFFSET = self.SQUARE_SIZE // 4  
+        self.dirty = []
         self.show_lines()
 
     def show_lines(self):
         """
-        Show the grid lines on the board.
-        """
-        self.screen.fill(BG_COLOR)
-        self.draw_lines()
-
-    def draw_lines(self):
-        """
-        Draw the grid lines.
-        """
-        [pygame.draw.line(self.screen, LINE_COLOR, (col * self.SQUARE_SIZE, 0), (col * self.SQUARE_SIZE, HEIGHT), LINE_WIDTH) for col in range(1, self.size)]
-        [pygame.draw.line(self.screen, LINE_COLOR, (0, row * self.SQUARE_SIZE), (WIDTH, row * self.SQUARE_SIZE), LINE_WIDTH) for row in range(1, self.size)]
-
-    def draw_cross(self, row, col):
-        """
-        Draw a cross (X) on the board.
+        Show the empty board with its grid lines, and mark the whole window for redrawing.
         """
-        positions = self.calculate_cross_positions(row, col)
-        [pygame.draw.line(self.screen, CROSS_COLOR, start, end, self.CROSS_WIDTH) for start, end in positions]
+        self.screen.blit(grid_surface(self.size, self.SQUARE_SIZE), (0, 0))
+        self.dirty = [self.screen.get_rect()]
 
-    def calculate_cross_positions(self, row, col):
-        """
-        Calculate positions for drawing a cross.
-        """
-        start_desc = (col * self.SQUARE_SIZE + self.OFFSET, row * self.SQUARE_SIZE + self.OFFSET)
-        end_desc = (col * self.SQUARE_SIZE + self.SQUARE_SIZE - self.OFFSET, row * self.SQUARE_SIZE + self.SQUARE_SIZE - self.OFFSET)
-        start_asc = (col * self.SQUARE_SIZE + self.OFFSET, row * self.SQUARE_SIZE + self.SQUARE_SIZE - self.OFFSET)
-        end_asc = (col * self.SQUARE_SIZE + self.SQUARE_SIZE - self.OFFSET, row * self.SQUARE_SIZE + self.OFFSET)
-        return [(start_desc, end_desc), (start_asc, end_asc)]
-
-    def draw_circle(self, row, col):
+    def draw_fig(self, row, col):
         """
-        Draw a circle (O) on the board.
+        Draw the current player's figure (X or O) and mark its square for redrawing.
         """
-        center = (col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2, row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2)
-        pygame.draw.circle(self.screen, CIRC_COLOR, center, self.CIRCLE_RADIUS, self.CIRC_WIDTH)
+        position = (col * self.SQUARE_SIZE, row * self.SQUARE_SIZE)
+        self.dirty.append(self.screen.blit(figure_surface(self.player, self.SQUARE_SIZE), position))
 
-    def draw_fig(self, row, col):
+    def flush(self):
         """
-        Draw the current player's figure (X or O).
+        Update the parts of the window drawn since the last flush.
         """
-        draw_methods = {1: self.draw_cross, 2: self.draw_circle}
-        draw_methods[self.player](row, col)
+        if self.dirty:
+            pygame.display.update(self.dirty)
+            self.dirty = []
 
     def display_message(self, message):
         """
         Display a message on the screen.
         """
-        font = pygame.font.Font(None, 74)
-        text = font.render(message, True, (255, 255, 255))
+        text = text_surface(message, 74)
         text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
         self.screen.blit(text, text_rect)
         pygame.display.update()
@@ -102,9 +152,31 @@ class Game:
         """
         Check if the game is over.
         """
-        result = self.board.final_state(self.screen, show=True)
+        result = self.board.final_state()
+        if result:
+            kind, _, mask = self.board.winning_line()
+            self.draw_win_line(kind, mask, result)
         return self.check_game_over(result)
 
+    def draw_win_line(self, kind, mask, player):
+        """
+        Draw the line through a winning row, column or diagonal and mark it for redrawing.
+
+        The line runs from the first to the last square of the mask and reaches
+        to 20 pixels from the outer edges of those squares.
+        """
+        color = CIRC_COLOR if player == 2 else CROSS_COLOR
+        first = divmod((mask & -mask).bit_length() - 1, self.size)
+        last = divmod(mask.bit_length() - 1, self.size)
+        d_row = (last[0] > first[0]) - (last[0] < first[0])
+        d_col = (last[1] > first[1]) - (last[1] < first[1])
+        reach = self.SQUARE_SIZE // 2 - 20
+        half = self.SQUARE_SIZE // 2
+        iPos = (first[1] * self.SQUARE_SIZE + half - d_col * reach, first[0] * self.SQUARE_SIZE + half - d_row * reach)
+        fPos = (last[1] * self.SQUARE_SIZE + half + d_col * reach, last[0] * self.SQUARE_SIZE + half + d_row * reach)
+        width = LINE_WIDTH if kind in ('col', 'row') else CROSS_WIDTH
+        self.dirty.append(pygame.draw.line(self.screen, color, iPos, fPos, width))
+
     def check_game_over(self, result):
         """
         Check the game over condition and display the result.
@@ -117,8 +189,8 @@ class Game:
 
     def reset(self):
         """
-        Reset the game.
+        Reset the game, keeping the AI and everything it has learned.
         """
-        self.__init__(self.size, self.screen)
+        self.__init__(self.size, self.screen, self.ai)
 
 # Some parts of the design were inspired by https://www.youtube.com/watch?v=LbTu0rwikwg&t=90s
\ No newline at end of file
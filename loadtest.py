@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from board import Board
+from server import percentiles
+
+
+class EngineClient:
+    def __init__(self, reader, writer):
+        """
+        Initialize a client of the engine server on an open connection.
+
+        Requests are sent without waiting for earlier answers, and answers are
+        matched back to their requests by id. The round-trip time of every
+        request is kept in self.latencies, in milliseconds.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.latencies = []
+        self.ids = itertools.count()
+        self.waiting = {}
+        self.listener = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        """
+        Hand each answer line to the request waiting for it.
+        """
+        while line := await self.reader.readline():
+            response = json.loads(line)
+            future = self.waiting.pop(response['id'], None)
+            if future is not None:
+                future.set_result(response)
+        for future in self.waiting.values():
+            future.set_exception(ConnectionError("the server closed the connection"))
+
+    async def request(self, **request):
+        """
+        Send a request and wait for its answer.
+
+        Returns:
+            dict: The server's answer.
+        """
+        start = time.perf_counter()
+        request['id'] = next(self.ids)
+        future = self.waiting[request['id']] = asyncio.get_running_loop().create_future()
+        self.writer.write((json.dumps(request) + '\n').encode())
+        await self.writer.drain()
+        response = await future
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return response
+
+    async def close(self):
+        """
+        Close the connection and wait for the server's last answers.
+        """
+        self.writer.close()
+        await self.listener
+
+
+async def play(client, game, settings, results):
+    """
+    Play one game as X with random moves against the server, recording every answer.
+
+    Raises:
+        RuntimeError: If the server answers with an error.
+    """
+    rng = random.Random(settings['seed'] * 1000003 + game)
+    board = Board(settings['size'], 0, settings['win_length'])
+    while True:
+        board.mark_sqr(*rng.choice(board.get_empty_sqrs()), 1)
+        if board.winner() or board.isfull():
+            return
+        request = {'size': board.size, 'win_length': board.win_length, 'moves': board.moves}
+        if settings['time_ms'] is not None:
+            request['time_ms'] = settings['time_ms']
+        response = await client.request(**request)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        results.append(response)
+        board.mark_sqr(*response['move'], 2)
+        if board.winner() or board.isfull():
+            return
+
+
+async def run(settings):
+    """
+    Play games against an engine server, several at a time, and summarize the answers.
+
+    Starts a server over stdin/stdout when no port is given.
+
+    Returns:
+        dict: The number of requests, requests per second, client-side and
+        server-side latency percentiles in milliseconds, and the count of each answer source.
+    """
+    process = None
+    if settings['port'] is None:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+            '--workers', str(settings['workers']), stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        client = EngineClient(process.stdout, process.stdin)
+    else:
+        client = EngineClient(*await asyncio.open_connection(settings['host'], settings['port']))
+
+    # Wait until the server is up, so its start-up is not counted.
+    await client.request(stats=True)
+    client.latencies = []
+    results = []
+    games = iter(range(settings['games']))
+
+    async def player():
+        for game in games:
+            await play(client, game, settings, results)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(player() for _ in range(settings['concurrency'])))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    if process is not None:
+        await process.wait()
+    return {
+        'requests': len(client.latencies),
+        'requests_per_sec': round(len(client.latencies) / elapsed, 1),
+        'latency_ms': percentiles(client.latencies),
+        'server_latency_ms': percentiles([result['latency_ms'] for result in results]),
+        'sources': dict(collections.Counter(result['source'] for result in results)),
+    }
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line into load test settings.
+    """
+    parser = argparse.ArgumentParser(description="Load test the engine server with concurrent random games.")
+    parser.add_argument('--port', type=int, default=None, help="port of a running server; starts one if not given")
+    parser.add_argument('--host', default='127.0.0.1', help="address of the running server")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes of a started server")
+    parser.add_argument('--games', type=int, default=50, help="number of games to play")
+    parser.add_argument('--concurrency', type=int, default=10, help="games in progress at once")
+    parser.add_argument('--size', type=int, default=3, help="board size")
+    parser.add_argument('--win-length', type=int, default=None, help="marks in a row to win, the board size by default")
+    parser.add_argument('--time-ms', type=float, default=None, help="time budget per move, the server's default if not given")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the random moves")
+    return vars(parser.parse_args(argv))
+
+
+def main(argv=None):
+    """
+    Run a load test from the command line and print its summary as JSON.
+    """
+    print(json.dumps(asyncio.run(run(parse_args(argv))), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,26 @@
 import pygame
 import sys
-from game import Game
+from game import Game, text_surface
+from thinker import Thinker
 from constants import *
 
+# Posted by the thinker's thread when the AI's move is ready.
+AI_MOVE_EVENT = pygame.USEREVENT + 1
+# The only events the loops react to; others are dropped so they do not wake the loop.
+HANDLED_EVENTS = [pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.WINDOWEXPOSED, AI_MOVE_EVENT]
+
 def render_text(screen, text, font_size, position, color=(255, 255, 255)):
     """
     Render text on the screen.
     """
-    font = pygame.font.Font(None, font_size)
-    text_surface = font.render(text, True, color)
-    screen.blit(text_surface, position)
+    screen.blit(text_surface(text, font_size, color), position)
+
+def wait_events(clock):
+    """
+    Sleep until there is at least one event, at most FPS times a second, and return all pending events.
+    """
+    clock.tick(FPS)
+    return [pygame.event.wait()] + pygame.event.get()
 
 def draw_input_box(screen, input_text):
     """
@@ -23,11 +34,11 @@ def draw_input_box(screen, input_text):
     pygame.display.flip()
     return input_box
 
-def handle_input_events(input_text):
+def handle_input_events(input_text, events):
     """
     Handle input events for board size.
     """
-    for event in pygame.event.get():
+    for event in events:
         if event.type == pygame.QUIT:
             pygame.quit()
             sys.exit()
@@ -39,72 +50,97 @@ def handle_input_events(input_text):
                         raise ValueError("Size must be 3 or greater")
                     return size
                 except ValueError:
-                    return ''
+                    input_text = ''
             elif event.key == pygame.K_BACKSPACE:
-                return input_text[:-1]
+                input_text = input_text[:-1]
             else:
-                return input_text + event.unicode
+                input_text += event.unicode
     return input_text
 
 def get_board_size(screen):
     """
     Get the board size from user input.
     """
+    clock = pygame.time.Clock()
     input_text = ''
+    draw_input_box(screen, input_text)
     while True:
-        input_text = handle_input_events(input_text)
+        input_text = handle_input_events(input_text, wait_events(clock))
         if isinstance(input_text, int):
             return input_text
         draw_input_box(screen, input_text)
 
-def handle_game_events(game, board, ai):
+def handle_game_events(game, thinker, events):
     """
     Handle game events.
     """
-    for event in pygame.event.get():
+    for event in events:
         if event.type == pygame.QUIT:
             pygame.quit()
             sys.exit()
         if event.type == pygame.KEYDOWN:
-            handle_keydown_events(event, game, board, ai)
+            handle_keydown_events(event, game, thinker)
         if event.type == pygame.MOUSEBUTTONDOWN:
-            handle_mouse_events(event, game, board, ai)
+            handle_mouse_events(event, game, thinker)
+        if event.type == pygame.WINDOWEXPOSED:
+            game.dirty.append(game.screen.get_rect())
 
-def handle_keydown_events(event, game, board, ai):
+def handle_keydown_events(event, game, thinker):
     """
     Handle keydown events.
     """
     key_actions = {
         pygame.K_g: game.change_gamemode,
-        pygame.K_r: lambda: reset_game(game, board, ai),
-        pygame.K_0: lambda: set_ai_level(ai, 0),
-        pygame.K_1: lambda: set_ai_level(ai, 1)
+        pygame.K_r: lambda: reset_game(game, thinker),
+        pygame.K_0: lambda: set_ai_level(game.ai, 0),
+        pygame.K_1: lambda: set_ai_level(game.ai, 1)
     }
     action = key_actions.get(event.key)
     if action:
         action()
 
-def handle_mouse_events(event, game, board, ai):
+def handle_mouse_events(event, game, thinker):
     """
     Handle mouse events.
     """
     pos = event.pos
     row = pos[1] // SQUARE_SIZE
     col = pos[0] // SQUARE_SIZE
-    if board.empty_sqr(row, col) and game.running:
+    if row >= game.size or col >= game.size:
+        return
+    if game.gamemode == 'ai' and game.player == game.ai.player:
+        return
+    if game.board.empty_sqr(row, col) and game.running:
         game.make_move(row, col)
         if game.isover():
             game.running = False
+            thinker.cancel()
 
-def reset_game(game, board, ai):
+def reset_game(game, thinker):
     """
-    Reset the game.
+    Reset the game, abandoning any search in progress.
     """
+    thinker.cancel()
     game.reset()
-    board = game.board
-    ai = game.ai
+    thinker.attach(game.ai)
+    thinker.ponder(game.board)
     game.running = True
 
+def play_ai_move(game, thinker):
+    """
+    Play the AI's move once the background search has found it, then ponder
+    the opponent's replies.
+    """
+    thinker.think(game.board)
+    move = thinker.poll()
+    if move is None:
+        return
+    game.make_move(*move)
+    if game.isover():
+        game.running = False
+    else:
+        thinker.ponder(game.board)
+
 def set_ai_level(ai, level):
     """
     Set the AI level.
@@ -120,6 +156,8 @@ def main():
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption('TIC TAC TOE AI')
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(HANDLED_EVENTS)
 
     size = get_board_size(screen)
 
@@ -130,18 +168,16 @@ def main():
     CIRCLE_RADIUS = SQUARE_SIZE // 3
 
     game = Game(size, screen)
-    board = game.board
-    ai = game.ai
+    thinker = Thinker(game.ai, on_answer=lambda: pygame.event.post(pygame.event.Event(AI_MOVE_EVENT)))
+    thinker.ponder(game.board)
 
+    clock = pygame.time.Clock()
+    game.flush()
     while True:
-        handle_game_events(game, board, ai)
-        if game.gamemode == 'ai' and game.player == ai.player and game.running:
-            pygame.display.update()
-            row, col = ai.eval(board, screen)
-            game.make_move(row, col)
-            if game.isover():
-                game.running = False
-        pygame.display.update()
+        handle_game_events(game, thinker, wait_events(clock))
+        if game.gamemode == 'ai' and game.player == game.ai.player and game.running:
+            play_ai_move(game, thinker)
+        game.flush()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
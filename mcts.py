@@ -0,0 +1,168 @@
+import math
+import random
+import time
+from ai import SearchAborted
+from ordering import HeuristicOrdering
+
+
+class Node:
+    def __init__(self, move, parent, player, moves):
+        """
+        Initialize a node of the search tree.
+
+        Args:
+            move (tuple): The move that leads to the node, None at the root.
+            parent (Node): The node the move was made from, None at the root.
+            player (int): The player who made the move (1 or 2).
+            moves (list): The moves from the node that have no child yet.
+        """
+        self.move = move
+        self.parent = parent
+        self.player = player
+        self.untried = moves
+        self.children = []
+        self.visits = 0
+        self.reward = 0.0
+
+
+class MCTS:
+    def __init__(self, exploration=math.sqrt(2), radius=None, seed=None):
+        """
+        Initialize a Monte Carlo Tree Search using UCT.
+
+        Each iteration walks down the tree by the UCT formula, adds one new node,
+        plays random moves from there to the end of the game, and credits the
+        result to every node on the way. Playouts are played on the board itself
+        with mark_sqr and undone with unmark_sqr, so the winner is known after
+        every move without scanning the board.
+
+        Args:
+            exploration (float): The UCT exploration constant.
+            radius (int): Only add tree moves within this many squares of a mark, or None for all moves.
+            seed (int): Seed for the random playouts, for reproducible searches.
+        """
+        self.exploration = exploration
+        self.radius = radius
+        self.rng = random.Random(seed)
+        self.tactics = HeuristicOrdering()
+        self.stop = None
+        self.playouts = 0
+        self.tree_depth = 0
+
+    def search(self, board, player, time_budget_ms=None, playouts=None):
+        """
+        Search a position until the time or playout budget runs out.
+
+        When the player can win on the spot that move is played, and when the
+        opponent threatens to win only the blocking moves are considered. At
+        least one playout is always run.
+
+        Args:
+            board (Board): The current game board, which is back in its original state on return.
+            player (int): The player to move (1 or 2).
+            time_budget_ms (float): The wall-clock time allowed, or None.
+            playouts (int): The number of playouts allowed, or None.
+
+        Returns:
+            tuple: The most visited move and its average reward for the player, from 0 (loss) to 1 (win).
+
+        Raises:
+            SearchAborted: If the self.stop event is set.
+        """
+        deadline = None if time_budget_ms is None else time.perf_counter() + time_budget_ms / 1000
+        self.playouts = 0
+        self.tree_depth = 0
+        wins = self.tactics.threats(board, player)
+        if wins:
+            return wins[0], 1.0
+        moves = self.tactics.threats(board, 3 - player) or self.candidate_moves(board)
+        root = Node(None, None, 3 - player, list(dict.fromkeys(moves)))
+
+        while not root.children or (
+                (playouts is None or self.playouts < playouts) and
+                (deadline is None or time.perf_counter() < deadline)):
+            if self.stop is not None and self.stop.is_set():
+                raise SearchAborted
+            self.iterate(board, root)
+
+        best = max(root.children, key=lambda child: child.visits)
+        return best.move, best.reward / best.visits
+
+    def iterate(self, board, root):
+        """
+        Run one select, expand, playout and backpropagate step from the root.
+        """
+        node = root
+        path = 0
+        while not node.untried and node.children:
+            node = self.select(node)
+            board.mark_sqr(*node.move, node.player)
+            path += 1
+
+        if node.untried:
+            move = node.untried.pop()
+            player = 3 - node.player
+            board.mark_sqr(*move, player)
+            path += 1
+            over = board.winner() or board.isfull()
+            child = Node(move, node, player, [] if over else self.candidate_moves(board))
+            node.children.append(child)
+            node = child
+
+        winner = self.playout(board, 3 - node.player)
+        self.playouts += 1
+        self.tree_depth = max(self.tree_depth, path)
+        while node is not None:
+            node.visits += 1
+            if winner == node.player:
+                node.reward += 1
+            elif not winner:
+                node.reward += 0.5
+            node = node.parent
+        for _ in range(path):
+            board.unmark_sqr(*board.last_move)
+
+    def select(self, node):
+        """
+        Pick the child with the highest UCT value.
+        """
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        return max(node.children, key=lambda child: child.reward / child.visits +
+                   exploration * math.sqrt(log_visits / child.visits))
+
+    def candidate_moves(self, board):
+        """
+        Get the moves to add to the tree below a position, in random order.
+        """
+        moves = board.get_empty_sqrs() if self.radius is None else board.get_nearby_sqrs(self.radius)
+        self.rng.shuffle(moves)
+        return moves
+
+    def playout(self, board, player):
+        """
+        Play random moves to the end of the game and undo them.
+
+        Args:
+            board (Board): The position to play out from.
+            player (int): The player to move.
+
+        Returns:
+            int: The winner (1 or 2), or 0 for a draw.
+        """
+        winner = board.winner()
+        if winner:
+            return winner
+        moves = board.get_empty_sqrs()
+        self.rng.shuffle(moves)
+        played = 0
+        for row, col in moves:
+            board.mark_sqr(row, col, player)
+            played += 1
+            if board.wins[player]:
+                winner = player
+                break
+            player = 3 - player
+        for row, col in reversed(moves[:played]):
+            board.unmark_sqr(row, col)
+        return winner
@@ -0,0 +1,166 @@
+import functools
+from board import cell_lines
+
+
+@functools.lru_cache(maxsize=None)
+def static_order(size, win_length=None):
+    """
+    Rank the squares of a board by how promising they are on an empty board.
+
+    A square through more lines ranks higher, and among those the one nearer the
+    centre ranks higher.
+
+    Returns:
+        tuple: One priority per square, indexed by row * size + col.
+    """
+    center = (size - 1) / 2
+    lines = cell_lines(size, win_length)
+    return tuple(len(lines[idx]) * size * size - abs(idx // size - center) - abs(idx % size - center)
+                 for idx in range(size * size))
+
+
+class MoveOrdering:
+    def order(self, board, moves, player, depth, first_moves=()):
+        """
+        Order the moves of a node for searching.
+
+        The base ordering keeps the board's row-major order and only puts the
+        given first moves in front.
+
+        Args:
+            board (Board): The current game board.
+            moves (list): The legal moves, which may be reordered in place.
+            player (int): The player to move (1 or 2).
+            depth (int): The depth of the node from the root.
+            first_moves (tuple): Moves to search before any others, best first, or None.
+
+        Returns:
+            list: The moves in search order.
+        """
+        for move in reversed(first_moves):
+            if move in moves:
+                moves.remove(move)
+                moves.insert(0, move)
+        return moves
+
+    def cutoff(self, move, player, depth, remaining):
+        """
+        Record that a move caused a beta cutoff.
+
+        Args:
+            move (tuple): The move that caused the cutoff.
+            player (int): The player who made it (1 or 2).
+            depth (int): The depth of the node from the root.
+            remaining (int): The depth left to search below the node.
+        """
+
+    def new_search(self):
+        """
+        Prepare for a new search from a new root position.
+        """
+
+    def clear(self):
+        """
+        Forget everything learned from earlier searches.
+        """
+
+
+class HeuristicOrdering(MoveOrdering):
+    def __init__(self, killers_per_ply=2):
+        """
+        Initialize the killer move slots and the history table.
+
+        Args:
+            killers_per_ply (int): The number of killer moves remembered per depth.
+        """
+        self.killers_per_ply = killers_per_ply
+        self.killers = []
+        self.history = {1: {}, 2: {}}
+
+    def order(self, board, moves, player, depth, first_moves=()):
+        """
+        Order the moves of a node for searching.
+
+        The first moves (the transposition table and principal variation moves)
+        come first, then moves that win on the spot, then moves that block the
+        opponent's win, then this depth's killer moves. The rest follow by
+        history score, with ties broken by the static centre/line order.
+
+        Args:
+            board (Board): The current game board.
+            moves (list): The legal moves, which may be reordered in place.
+            player (int): The player to move (1 or 2).
+            depth (int): The depth of the node from the root.
+            first_moves (tuple): Moves to search before any others, best first, or None.
+
+        Returns:
+            list: The moves in search order.
+        """
+        size = board.size
+        history = self.history[player]
+        static = static_order(size, board.win_length)
+        moves.sort(key=lambda move: (history.get(move, 0), static[move[0] * size + move[1]]), reverse=True)
+
+        front = list(first_moves)
+        front += self.threats(board, player)
+        front += self.threats(board, 3 - player)
+        if depth < len(self.killers):
+            front += self.killers[depth]
+        return super().order(board, moves, player, depth, front)
+
+    def threats(self, board, player):
+        """
+        Find the squares that would complete a line for a player.
+
+        The board keeps its threatened lines up to date as moves are made, so
+        this costs nothing when there are no threats, whatever the board size.
+
+        Args:
+            board (Board): The current game board.
+            player (int): The player (1 or 2).
+
+        Returns:
+            list: The squares that win for the player.
+        """
+        return board.threat_squares(player) if board.threat_lines[player] else []
+
+    def cutoff(self, move, player, depth, remaining):
+        """
+        Record that a move caused a beta cutoff.
+
+        The move becomes the newest killer at its depth and its history score
+        grows by the square of the depth left below the node.
+
+        Args:
+            move (tuple): The move that caused the cutoff.
+            player (int): The player who made it (1 or 2).
+            depth (int): The depth of the node from the root.
+            remaining (int): The depth left to search below the node.
+        """
+        while len(self.killers) <= depth:
+            self.killers.append([])
+        killers = self.killers[depth]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.killers_per_ply:]
+        history = self.history[player]
+        history[move] = history.get(move, 0) + remaining * remaining
+
+    def new_search(self):
+        """
+        Prepare for a new search from a new root position.
+
+        Killer moves are forgotten and history scores are halved, so that the
+        previous search still counts but fades.
+        """
+        self.killers = []
+        for history in self.history.values():
+            for move in history:
+                history[move] //= 2
+
+    def clear(self):
+        """
+        Forget all killer moves and history scores.
+        """
+        self.killers = []
+        self.history = {1: {}, 2: {}}
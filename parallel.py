@@ -0,0 +1,217 @@
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from ai import MiniMax, SearchAborted
+from transposition import EXACT
+
+# Per-process search state, set up by _init_worker.
+_minimax = None
+_shared = None
+# The table generation of the caller's last search, see _search_root_move.
+_search = None
+
+
+class _Superseded:
+    def __init__(self, generation):
+        """
+        Stand in for a stop event that is set once a newer search has started.
+        """
+        self.generation = generation
+
+    def is_set(self):
+        """
+        Check if the search this worker is running has been superseded.
+        """
+        return _shared[0] != self.generation
+
+
+def _init_worker(shared, tt_size, tt_replacement):
+    """
+    Set up a worker process with its own MiniMax and the shared root bound.
+    """
+    global _minimax, _shared
+    _minimax = MiniMax(tt_size=tt_size, tt_replacement=tt_replacement)
+    _shared = shared
+
+
+def _search_root_move(board, player, move, index, max_depth, pv, radius, search, generation, deadline):
+    """
+    Search one root move in a worker process.
+
+    The window comes from the best root score found so far by any worker. A move
+    ordered before the current best only needs to tie it to take its place, so
+    its window is opened one point below that score.
+
+    When the caller has started a new search from a new position, the worker
+    starts one too, so its table and move ordering age out the old one just as
+    the caller's do. The iterations of one search share both.
+
+    Args:
+        board (Board): The root position.
+        player (int): The player to move at the root (1 or 2).
+        move (tuple): The root move to search.
+        index (int): The position of the move in the root move order.
+        max_depth (int): The depth of the whole search.
+        pv (list): The principal variation of the previous search, for move ordering.
+        radius (int): The move radius of the search, see MiniMax.
+        search (int): The table generation of the caller's MiniMax, which changes with each new search.
+        generation (int): Identifies the search, so results of an abandoned one are ignored.
+        deadline (float): The time.time() at which to give up, or None.
+
+    Returns:
+        tuple: The move's score for the player, its principal variation and the search counters
+        (see MiniMax.counters), or None if the deadline passed or the search was abandoned.
+    """
+    with _shared.get_lock():
+        current, best, best_index = _shared[:]
+    if current != generation:
+        return None
+    alpha = best if best_index < index else best - 1
+
+    global _search
+    if search != _search:
+        _minimax.tt.new_search()
+        _minimax.ordering.new_search()
+        _search = search
+    _minimax.max_depth = max_depth
+    _minimax.pv = pv
+    _minimax.radius = radius
+    _minimax.reset_counters()
+    _minimax.stop = _Superseded(generation)
+    if deadline is not None:
+        _minimax.deadline = time.perf_counter() + deadline - time.time()
+    opponent = 3 - player
+    board.mark_sqr(*move, player)
+    try:
+        score = -_minimax.negamax(board, -math.inf, -alpha, 1, opponent)[1]
+    except SearchAborted:
+        return None
+    finally:
+        _minimax.deadline = None
+    child_pv = _minimax.principal_variation(board, opponent, max_depth - 1)
+
+    if score > alpha:
+        with _shared.get_lock():
+            current, best, best_index = _shared[:]
+            if current == generation and (score > best or (score == best and index < best_index)):
+                _shared[1], _shared[2] = score, index
+    return score, child_pv, _minimax.counters()
+
+
+class ParallelSearch:
+    def __init__(self, workers, tt_size=1 << 16, tt_replacement='depth', min_depth=3):
+        """
+        Initialize a root-splitting search over a pool of worker processes.
+
+        Each worker keeps its own transposition table between searches. The best
+        root score so far is shared between workers, so later root moves are
+        searched with the tightest window available.
+
+        Args:
+            workers (int): The number of worker processes.
+            tt_size (int): The number of slots in each worker's transposition table.
+            tt_replacement (str): The transposition table replacement policy, 'depth' or 'always'.
+            min_depth (int): Searches shallower than this run serially, where
+                dispatching to the pool would cost more than it saves.
+        """
+        self.workers = workers
+        self.tt_size = tt_size
+        self.tt_replacement = tt_replacement
+        self.min_depth = min_depth
+        self.context = multiprocessing.get_context('spawn')
+        self.shared = self.context.Array('d', 3)
+        self.executor = None
+
+    def search(self, minimax, board, player):
+        """
+        Search a position, splitting its root moves across the worker processes.
+
+        Uses the depth, principal variation, move ordering, move radius, deadline
+        and stop event of the given MiniMax, and returns the same move and score as its
+        negamax would at that depth.
+
+        Args:
+            minimax (MiniMax): The search whose settings to use.
+            board (Board): The current game board.
+            player (int): The player to move (1 or 2).
+
+        Returns:
+            list: The best move and its score for the player.
+
+        Raises:
+            SearchAborted: If the deadline of the MiniMax passes or it is told to stop.
+        """
+        if minimax.max_depth < self.min_depth or minimax.is_terminal(board):
+            best_move = minimax.negamax(board, -math.inf, math.inf, 0, player)
+            minimax.pv = minimax.principal_variation(board, player, minimax.max_depth)
+            return best_move
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=self.context, initializer=_init_worker,
+                initargs=(self.shared, self.tt_size, self.tt_replacement))
+
+        key, sym = minimax.tt_key(board, player)
+        entry = minimax.tt_probe(board, key, sym)
+        moves = minimax.ordered_moves(board, player, 0, entry[4] if entry else None)
+        with self.shared.get_lock():
+            generation = self.shared[0] + 1
+            self.shared[:] = [generation, -math.inf, len(moves)]
+        deadline = None
+        if minimax.deadline is not None:
+            deadline = time.time() + minimax.deadline - time.perf_counter()
+
+        futures = [self.executor.submit(_search_root_move, board, player, move, index,
+                                        minimax.max_depth, minimax.pv, minimax.radius, minimax.tt.generation,
+                                        generation, deadline)
+                   for index, move in enumerate(moves)]
+        results = []
+        try:
+            for future in futures:
+                result = self.wait(minimax, future)
+                if result is None:
+                    raise SearchAborted
+                results.append(result)
+        except SearchAborted:
+            with self.shared.get_lock():
+                self.shared[0] += 1
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+        with self.shared.get_lock():
+            best_index = int(self.shared[2])
+        for _, _, counters in results:
+            minimax.add_counters(counters)
+        if best_index == len(moves):
+            # No move beat its window; like the serial search, fall back to the first one.
+            best_index = 0
+        move = moves[best_index]
+        score, child_pv, _ = results[best_index]
+        minimax.pv = [move] + child_pv
+        minimax.tt_store(board, key, sym, minimax.max_depth, score, EXACT, move)
+        return [move, score]
+
+    def wait(self, minimax, future):
+        """
+        Wait for a root move's result, checking whether the search should stop meanwhile.
+
+        Raises:
+            SearchAborted: If the stop event of the MiniMax is set.
+        """
+        while True:
+            try:
+                return future.result(timeout=0.05)
+            except TimeoutError:
+                if minimax.stop is not None and minimax.stop.is_set():
+                    raise SearchAborted
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+import time
+from board import inverse_symmetries, symmetries
+from transposition import O_TO_MOVE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    size INTEGER NOT NULL,
+    win_length INTEGER NOT NULL,
+    key INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    score REAL NOT NULL,
+    move INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (size, win_length, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_used ON positions (used);
+"""
+
+# Probes only read; the recency of the entries they hit is written in batches
+# of this many, or with the next store, so readers never wait on the writer lock.
+TOUCH_BATCH = 256
+
+
+class PositionCache:
+    def __init__(self, path, max_entries=100000):
+        """
+        Open a persistent cache of searched positions in an SQLite file, creating it if needed.
+
+        Each entry maps a position, by its canonical hash and side to move, to
+        the depth it was searched to, its score and its best move in the
+        canonical orientation, so rotations and reflections share an entry. The
+        file is in WAL mode, so several processes can read it while one writes.
+        Once it holds more than max_entries positions, the least recently used
+        ones are evicted, a tenth of max_entries at a time. Eviction is
+        approximate: recency from probes is written in batches, and the row
+        count is tracked per process and only recounted when it passes the limit.
+
+        Args:
+            path (str): The cache file.
+            max_entries (int): The most positions to keep.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # The AI may be used from the thinker's thread, so the connection is shared behind self.lock.
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.touched = {}
+        self.count = self.db.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def key(self, board, player):
+        """
+        Get the cache key of a position.
+
+        Args:
+            board (Board): The position.
+            player (int): The player to move (1 or 2).
+
+        Returns:
+            tuple: The (size, win_length, key) of the position, with the key as a
+            signed 64-bit integer for SQLite, and the index of the symmetry that
+            takes the board to its canonical orientation.
+        """
+        key, sym = board.canonical_hash()
+        if player == 2:
+            key ^= O_TO_MOVE
+        if key >= 1 << 63:
+            key -= 1 << 64
+        return (board.size, board.win_length, key), sym
+
+    def probe(self, board, player):
+        """
+        Look up a position, marking it as recently used.
+
+        Args:
+            board (Board): The position.
+            player (int): The player to move (1 or 2).
+
+        Returns:
+            tuple: The (depth, score, move) of the entry, with the move as (row, col)
+            on this board, or None if the position is not in the cache.
+        """
+        key, sym = self.key(board, player)
+        with self.lock:
+            row = self.db.execute('SELECT depth, score, move FROM positions WHERE size = ? AND win_length = ? AND key = ?',
+                                  key).fetchone()
+            if row is None:
+                return None
+            self.touched[key] = time.time()
+            if len(self.touched) >= TOUCH_BATCH:
+                with self.db:
+                    self.write_touched()
+        depth, score, move = row
+        return depth, score, divmod(inverse_symmetries(board.size)[sym][move], board.size)
+
+    def store(self, board, player, depth, score, move):
+        """
+        Store a search result, unless the position is already stored from a deeper search.
+
+        Args:
+            board (Board): The position.
+            player (int): The player to move (1 or 2).
+            depth (int): The depth the position was searched to.
+            score (float): The score of the position.
+            move (tuple): The best move as (row, col).
+        """
+        key, sym = self.key(board, player)
+        move = symmetries(board.size)[sym][move[0] * board.size + move[1]]
+        with self.lock, self.db:
+            self.write_touched()
+            self.db.execute(
+                'INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (size, win_length, key) DO UPDATE SET '
+                'depth = excluded.depth, score = excluded.score, move = excluded.move, used = excluded.used '
+                'WHERE excluded.depth >= positions.depth',
+                key + (depth, score, move, time.time()))
+            # Counts updates of existing entries too, so it only ever overestimates.
+            self.count += 1
+            if self.count > self.max_entries:
+                self.count = self.db.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+                if self.count > self.max_entries:
+                    keep = self.max_entries - self.max_entries // 10
+                    self.db.execute('DELETE FROM positions WHERE (size, win_length, key) IN '
+                                    '(SELECT size, win_length, key FROM positions ORDER BY used LIMIT ?)',
+                                    (self.count - keep,))
+                    self.count = keep
+
+    def write_touched(self):
+        """
+        Write the recency of the entries probed since the last write, inside the caller's transaction.
+        """
+        if self.touched:
+            self.db.executemany('UPDATE positions SET used = ? WHERE size = ? AND win_length = ? AND key = ?',
+                                [(used,) + key for key, used in self.touched.items()])
+            self.touched.clear()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def close(self):
+        """
+        Write the pending recency updates and close the cache file.
+        """
+        with self.lock:
+            with self.db:
+                self.write_touched()
+            self.db.close()
@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import struct
+from board import Board
+
+# A record file starts with the magic and version, followed by entries. A header
+# entry gives the board size, win length and engine config of the games after it,
+# until the next header. Appending to a file adds a header and then games.
+MAGIC = b'TTTG'
+VERSION = 2
+FILE_HEADER = struct.Struct('<4sH')
+
+# The first byte of an entry. A header entry has HEADER_ENTRY set, followed by
+# the size, the win length and the config as length-prefixed JSON. A game entry
+# has the winner in the low two bits (0 for a draw) and the flags below,
+# followed by the move count and the moves as square indices, then the evals
+# and the times if flagged. Counts, moves and times are unsigned LEB128 varints,
+# so a move is one byte on boards up to 11x11.
+HEADER_ENTRY = 0x80
+WINNER_MASK = 0x03
+HAS_EVALS = 0x04
+HAS_TIMES = 0x08
+SWAPPED = 0x10
+
+# Evals are float32: exact for every search score, including the win scores
+# near ai.WIN_SCORE that count the moves to a win, and NaN where there was none.
+EVAL = struct.Struct('<f')
+
+# Times are stored in units of 10 microseconds, two bytes for moves up to 160 ms.
+TIME_UNITS_PER_MS = 100
+
+
+def encode_varint(value, out):
+    """
+    Append a non-negative integer to a bytearray as an unsigned LEB128 varint.
+    """
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """
+    Read an unsigned LEB128 varint.
+
+    Args:
+        data (bytes): The encoded data.
+        pos (int): Where the varint starts.
+
+    Returns:
+        tuple: The value and the position just after it.
+
+    Raises:
+        IndexError: If the data ends inside the varint.
+    """
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class GameRecord:
+    def __init__(self, size, win_length, config, squares, winner, evals=None, times=None, swapped=False):
+        """
+        Initialize a record of one finished game.
+
+        Args:
+            size (int): The board size.
+            win_length (int): The marks in a row needed to win.
+            config (dict): The engine config from the header the game was written under.
+            squares (list): The moves as square indices (row * size + col), X first.
+            winner (int): The winner (1 or 2), or 0 for a draw.
+            evals (list): The engine's score of each move, NaN where there was none, or None.
+            times (list): The time taken by each move in milliseconds, or None.
+            swapped (bool): For configs that describe two engines, whether the second one played X.
+        """
+        self.size = size
+        self.win_length = win_length
+        self.config = config
+        self.squares = squares
+        self.winner = winner
+        self.evals = evals
+        self.times = times
+        self.swapped = swapped
+
+    @property
+    def moves(self):
+        """
+        Get the moves as (row, col) tuples.
+        """
+        return [divmod(idx, self.size) for idx in self.squares]
+
+    def replay(self):
+        """
+        Play the game's moves on a new board, one at a time.
+
+        Yields:
+            Board: The board after each move; the same object, updated in place.
+        """
+        board = Board(self.size, 0, self.win_length)
+        for i, (row, col) in enumerate(self.moves):
+            board.mark_sqr(row, col, 1 + i % 2)
+            yield board
+
+    def board(self):
+        """
+        Get the final position of the game.
+        """
+        board = Board(self.size, 0, self.win_length)
+        for board in self.replay():
+            pass
+        return board
+
+
+class RecordWriter:
+    def __init__(self, path, size, win_length=None, config=None):
+        """
+        Open a record file for appending games, creating it if needed.
+
+        A header with the board size, win length and engine config is written
+        first, so files can collect games from several runs.
+
+        Args:
+            path (str): The record file.
+            size (int): The board size of the games.
+            win_length (int): The marks in a row needed to win, the board size by default.
+            config (dict): The engine config to store with the games, any JSON value.
+
+        Raises:
+            ValueError: If the file exists and is not a record file of this version.
+        """
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb') as f:
+                if f.read(FILE_HEADER.size) != FILE_HEADER.pack(MAGIC, VERSION):
+                    raise ValueError(f"{path} is not a version {VERSION} game record file")
+        self.size = size
+        self.file = open(path, 'ab')
+        out = bytearray()
+        if self.file.tell() == 0:
+            out += FILE_HEADER.pack(MAGIC, VERSION)
+        text = json.dumps(config, separators=(',', ':')).encode()
+        out += bytes((HEADER_ENTRY, size, win_length or size))
+        encode_varint(len(text), out)
+        out += text
+        self.file.write(out)
+        self.count = 0
+
+    def write(self, moves, winner, evals=None, times=None, swapped=False):
+        """
+        Append one game.
+
+        Args:
+            moves (list): The moves as (row, col), X first.
+            winner (int): The winner (1 or 2), or 0 for a draw.
+            evals (list): The engine's score of each move, None where there was none.
+            times (list): The time taken by each move in milliseconds.
+            swapped (bool): Whether the config's second engine played X.
+
+        Raises:
+            ValueError: If evals or times do not have one entry per move.
+        """
+        for name, values in (('evals', evals), ('times', times)):
+            if values is not None and len(values) != len(moves):
+                raise ValueError(f"{name} has {len(values)} entries for {len(moves)} moves")
+        flags = winner | (HAS_EVALS if evals is not None else 0) | (HAS_TIMES if times is not None else 0) \
+            | (SWAPPED if swapped else 0)
+        out = bytearray((flags,))
+        encode_varint(len(moves), out)
+        for row, col in moves:
+            encode_varint(row * self.size + col, out)
+        if evals is not None:
+            for score in evals:
+                out += EVAL.pack(float('nan') if score is None else score)
+        if times is not None:
+            for ms in times:
+                encode_varint(round(ms * TIME_UNITS_PER_MS), out)
+        self.file.write(out)
+        self.count += 1
+
+    def flush(self):
+        """
+        Write the buffered games to the file.
+        """
+        self.file.flush()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self.file.close()
+
+
+def parse_entry(data, pos, header):
+    """
+    Decode the entry at a position.
+
+    Args:
+        data (bytes): The encoded entries.
+        pos (int): Where the entry starts.
+        header (tuple): The (size, win_length, config) of the last header, or None.
+
+    Returns:
+        tuple: The new header, or the game's GameRecord, and the position just after the entry.
+
+    Raises:
+        IndexError: If the data ends inside the entry.
+        ValueError: If a game comes before any header.
+    """
+    flags = data[pos]
+    if flags & HEADER_ENTRY:
+        size, win_length = data[pos + 1], data[pos + 2]
+        length, pos = decode_varint(data, pos + 3)
+        if pos + length > len(data):
+            raise IndexError
+        return (size, win_length, json.loads(data[pos:pos + length])), pos + length
+    if header is None:
+        raise ValueError("game entry before any header")
+    size, win_length, config = header
+    count, pos = decode_varint(data, pos + 1)
+    if size * size <= 0x80:
+        # Every square index fits in one byte.
+        if pos + count > len(data):
+            raise IndexError
+        squares = list(data[pos:pos + count])
+        pos += count
+    else:
+        squares = []
+        for _ in range(count):
+            idx, pos = decode_varint(data, pos)
+            squares.append(idx)
+    evals = times = None
+    if flags & HAS_EVALS:
+        end = pos + EVAL.size * count
+        if end > len(data):
+            raise IndexError
+        evals = [score for score, in EVAL.iter_unpack(data[pos:end])]
+        pos = end
+    if flags & HAS_TIMES:
+        times = []
+        for _ in range(count):
+            units, pos = decode_varint(data, pos)
+            times.append(units / TIME_UNITS_PER_MS)
+    record = GameRecord(size, win_length, config, squares, flags & WINNER_MASK, evals, times,
+                        bool(flags & SWAPPED))
+    return record, pos
+
+
+def read_records(path, chunk_size=1 << 16):
+    """
+    Stream the games of a record file.
+
+    The file is read chunk_size bytes at a time, so files of any size can be
+    scanned in constant memory. A truncated last game, as left by a writer
+    that was killed, is ignored.
+
+    Args:
+        path (str): The record file.
+        chunk_size (int): The bytes to read at a time.
+
+    Yields:
+        GameRecord: Each game, in the order written.
+
+    Raises:
+        ValueError: If the file is not a record file of this version.
+    """
+    with open(path, 'rb') as f:
+        if f.read(FILE_HEADER.size) != FILE_HEADER.pack(MAGIC, VERSION):
+            raise ValueError(f"{path} is not a version {VERSION} game record file")
+        header = None
+        data = b''
+        while chunk := f.read(chunk_size):
+            data += chunk
+            pos = 0
+            while pos < len(data):
+                try:
+                    entry, end = parse_entry(data, pos, header)
+                except IndexError:
+                    break
+                pos = end
+                if isinstance(entry, GameRecord):
+                    yield entry
+                else:
+                    header = entry
+            data = data[pos:]
+
+
+def summarize(path):
+    """
+    Scan a record file and count its games.
+
+    Returns:
+        dict: The number of games and moves, the games won by X, won by O and
+        drawn, and the bytes per game.
+    """
+    summary = {'games': 0, 'moves': 0, 'x_wins': 0, 'o_wins': 0, 'draws': 0}
+    keys = ('draws', 'x_wins', 'o_wins')
+    for record in read_records(path):
+        summary['games'] += 1
+        summary['moves'] += len(record.squares)
+        summary[keys[record.winner]] += 1
+    summary['bytes_per_game'] = round(os.path.getsize(path) / max(summary['games'], 1), 2)
+    return summary
+
+
+def main(argv=None):
+    """
+    Print a summary of record files as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Summarize binary game record files.")
+    parser.add_argument('paths', nargs='+', help="record files written by selfplay.py --records")
+    args = parser.parse_args(argv)
+    for path in args.paths:
+        print(json.dumps(dict(path=path, **summarize(path))))
+
+
+if __name__ == '__main__':
+    main()
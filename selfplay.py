@@ -0,0 +1,174 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from board import Board
+from ai import AI
+from ordering import HeuristicOrdering, MoveOrdering
+from records import RecordWriter
+
+ORDERINGS = {'heuristic': HeuristicOrdering, 'row-major': MoveOrdering}
+
+
+def make_ai(engine, player, cache=None):
+    """
+    Build an AI from an engine configuration.
+
+    Args:
+        engine (dict): The engine settings: 'engine', 'depth', 'time_ms', 'playouts' and 'ordering'.
+        player (int): The player number the AI plays (1 or 2).
+        cache (str): The persistent position cache file, or None.
+
+    Returns:
+        AI: The configured AI.
+    """
+    return AI(player=player, max_depth=engine['depth'], time_budget_ms=engine['time_ms'],
+              ordering=ORDERINGS[engine['ordering']](), engine=engine['engine'], playouts=engine['playouts'],
+              cache=cache)
+
+
+def play_game(task):
+    """
+    Play one game between two engine configurations.
+
+    Engine A plays X in even-numbered games and O in odd-numbered ones. The
+    first random_plies moves are random, seeded by the game number, so the
+    games differ even though the engines are deterministic.
+
+    Args:
+        task (tuple): The game number and the run settings from parse_args.
+
+    Returns:
+        dict: The game record: result for engine A, moves, per-move latency,
+        and the engine's score of each move (None for random and book moves).
+    """
+    game, settings = task
+    rng = random.Random(settings['seed'] * 1000003 + game)
+    a_player = 1 if game % 2 == 0 else 2
+    engines = {a_player: settings['a'], 3 - a_player: settings['b']}
+    ais = {player: make_ai(engine, player, settings['cache']) for player, engine in engines.items()}
+
+    board = Board(settings['size'], 0, settings['win_length'])
+    player = 1
+    latencies = []
+    evals = []
+    while not board.winner() and not board.isfull():
+        start = time.perf_counter()
+        score = None
+        if board.marked_sqrs < settings['random_plies']:
+            move = rng.choice(board.get_empty_sqrs())
+        else:
+            move, stats = ais[player].eval(board, return_stats=True)
+            if stats.iterations:
+                score = stats.iterations[-1]['score']
+        evals.append(score)
+        latencies.append(round((time.perf_counter() - start) * 1000, 3))
+        board.mark_sqr(*move, player)
+        player = 3 - player
+
+    winner = board.winner()
+    result = 'draw' if not winner else 'win' if winner == a_player else 'loss'
+    return {
+        'game': game,
+        'size': settings['size'],
+        'win_length': board.win_length,
+        'a_player': a_player,
+        'result': result,
+        'moves': board.moves,
+        'latency_ms': latencies,
+        'evals': evals,
+    }
+
+
+def run(settings, out, records=None):
+    """
+    Play all games across worker processes, writing each record as it finishes.
+
+    Args:
+        settings (dict): The run settings from parse_args.
+        out (file): Where to write one JSON record per line, without the evals.
+        records (RecordWriter): Where to also write each game in the binary record format, or None.
+
+    Returns:
+        dict: The number of wins, draws and losses for engine A.
+    """
+    totals = {'win': 0, 'draw': 0, 'loss': 0}
+    tasks = [(game, settings) for game in range(settings['games'])]
+    with multiprocessing.Pool(settings['workers']) as pool:
+        for record in pool.imap_unordered(play_game, tasks):
+            evals = record.pop('evals')
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            if records is not None:
+                winner = {'draw': 0, 'win': record['a_player'], 'loss': 3 - record['a_player']}[record['result']]
+                records.write(record['moves'], winner, evals, record['latency_ms'], swapped=record['a_player'] == 2)
+            totals[record['result']] += 1
+    return totals
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line into run settings.
+    """
+    parser = argparse.ArgumentParser(description="Play AI vs AI games without a display.")
+    parser.add_argument('--games', type=int, default=100, help="number of games to play")
+    parser.add_argument('--size', type=int, default=3, help="board size")
+    parser.add_argument('--win-length', type=int, default=None, help="marks in a row to win, the board size by default")
+    parser.add_argument('--random-plies', type=int, default=2, help="random opening moves per game")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the random openings")
+    parser.add_argument('--out', default='-', help="file for the JSON lines records, - for stdout")
+    parser.add_argument('--cache', default=None, help="persistent position cache file shared by all games")
+    parser.add_argument('--records', default=None, help="binary game record file to append the games to")
+    for side in ('a', 'b'):
+        parser.add_argument(f'--{side}-engine', choices=('minimax', 'mcts'), default='minimax',
+                            help=f"search algorithm of engine {side.upper()}")
+        parser.add_argument(f'--{side}-depth', type=int, default=4, help=f"search depth of engine {side.upper()}")
+        parser.add_argument(f'--{side}-time-ms', type=float, default=None,
+                            help=f"time budget per move of engine {side.upper()}, instead of a fixed depth")
+        parser.add_argument(f'--{side}-ordering', choices=sorted(ORDERINGS), default='heuristic',
+                            help=f"move ordering of engine {side.upper()}")
+        parser.add_argument(f'--{side}-playouts', type=int, default=None,
+                            help=f"playouts per move of engine {side.upper()} when it is mcts")
+    args = parser.parse_args(argv)
+    settings = {key: value for key, value in vars(args).items() if key[:2] not in ('a_', 'b_')}
+    for side in ('a', 'b'):
+        settings[side] = {
+            'engine': getattr(args, f'{side}_engine'),
+            'depth': getattr(args, f'{side}_depth'),
+            'time_ms': getattr(args, f'{side}_time_ms'),
+            'ordering': getattr(args, f'{side}_ordering'),
+            'playouts': getattr(args, f'{side}_playouts'),
+        }
+    return settings
+
+
+def main(argv=None):
+    """
+    Run a self-play match from the command line and print the score.
+    """
+    settings = parse_args(argv)
+    records = None
+    if settings['records'] is not None:
+        config = {key: settings[key] for key in ('a', 'b', 'random_plies', 'seed')}
+        records = RecordWriter(settings['records'], settings['size'], settings['win_length'], config)
+    start = time.perf_counter()
+    try:
+        if settings['out'] == '-':
+            totals = run(settings, sys.stdout, records)
+        else:
+            with open(settings['out'], 'a') as out:
+                totals = run(settings, out, records)
+    finally:
+        if records is not None:
+            records.close()
+    elapsed = time.perf_counter() - start
+    print(f"A: {totals['win']} wins, {totals['draw']} draws, {totals['loss']} losses "
+          f"in {elapsed:.1f}s ({settings['games'] / elapsed:.1f} games/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from ai import AI
+from board import Board
+
+# Per-process AIs, one per (size, win length, player, depth, time budget), and the position cache file, set up by _init_worker.
+_ais = None
+_cache = None
+
+
+def _init_worker(cache):
+    """
+    Set up a worker process with no AIs yet; they are created on first use and then kept.
+    """
+    global _ais, _cache
+    _ais = {}
+    _cache = cache
+
+
+def _ping():
+    """
+    Do nothing in a worker process, so starting the pool can be waited for.
+    """
+
+
+def _search(size, win_length, moves, depth, time_ms):
+    """
+    Find the best move of a position in a worker process.
+
+    The worker keeps one AI per game and engine setting, so its transposition
+    table, move ordering history and opening book stay warm from one request to
+    the next, and never carry over results from another board size or win length.
+
+    Args:
+        size (int): The board size.
+        win_length (int): The marks in a row needed to win.
+        moves (list): The moves played so far, X first.
+        depth (int): The search depth when there is no time budget.
+        time_ms (float): The time budget of the search, or None.
+
+    Returns:
+        dict: The move and the depth, score, nodes and time of the search.
+    """
+    board = Board(size, 0, win_length)
+    for row, col in moves:
+        board.mark_sqr(row, col, 1 + board.marked_sqrs % 2)
+    player = 1 + board.marked_sqrs % 2
+    key = (size, board.win_length, player, depth, time_ms)
+    ai = _ais.get(key)
+    if ai is None:
+        ai = _ais[key] = AI(player=player, max_depth=depth, time_budget_ms=time_ms, cache=_cache)
+    move, stats = ai.eval(board, return_stats=True)
+    summary = stats.as_dict()
+    return {
+        'move': list(move),
+        'score': summary['iterations'][-1]['score'] if summary['iterations'] else None,
+        'depth': summary['depth'],
+        'nodes': summary['nodes'],
+        'search_ms': summary['time_ms'],
+        'book': summary['book'],
+    }
+
+
+def parse_position(request):
+    """
+    Build the board of a request.
+
+    Args:
+        request (dict): Has 'size', optionally 'win_length', and 'moves', the
+            [row, col] moves played so far with X first.
+
+    Returns:
+        Board: The position, with the side to move following from the number of moves.
+
+    Raises:
+        ValueError: If the position is malformed, has an illegal move, or the game is over.
+    """
+    size = request['size']
+    win_length = request.get('win_length') or size
+    if not isinstance(size, int) or size < 3 or not isinstance(win_length, int) or not 3 <= win_length <= size:
+        raise ValueError("size must be an integer of 3 or more and win_length between 3 and size")
+    board = Board(size, 0, win_length)
+    for move in request.get('moves', []):
+        row, col = move
+        if board.winner():
+            raise ValueError("moves continue after the game was won")
+        if not (isinstance(row, int) and isinstance(col, int) and 0 <= row < size and 0 <= col < size) \
+                or not board.empty_sqr(row, col):
+            raise ValueError(f"illegal move {move}")
+        board.mark_sqr(row, col, 1 + board.marked_sqrs % 2)
+    if board.winner() or board.isfull():
+        raise ValueError("the game is over")
+    return board
+
+
+def percentiles(values):
+    """
+    Summarize latencies.
+
+    Returns:
+        dict: The 50th, 95th and 99th percentile and the maximum, rounded to microseconds.
+    """
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+    pick = lambda fraction: round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 3)}
+
+
+class EngineServer:
+    def __init__(self, workers=None, depth=4, time_ms=None, cache_size=100000, history=10000, position_cache=None):
+        """
+        Initialize a server that answers "position -> best move" requests from many clients.
+
+        Searches run in a pool of worker processes, each keeping warm AIs between
+        requests. Requests for a position that is already being searched wait for
+        that search instead of starting another, and finished answers are kept in
+        an LRU cache shared by all clients.
+
+        Args:
+            workers (int): The number of worker processes, the CPU count by default.
+            depth (int): The search depth of requests that give neither 'depth' nor 'time_ms'.
+            time_ms (float): The time budget of requests that do not give one, or None for a fixed depth.
+            cache_size (int): The number of answers to keep.
+            history (int): The number of recent latencies kept for the statistics.
+            position_cache (str): A persistent position cache file (see PositionCache) for
+                the workers to share, so results also outlive the server.
+        """
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(position_cache,))
+        self.depth = depth
+        self.time_ms = time_ms
+        self.cache_size = cache_size
+        self.answers = collections.OrderedDict()
+        self.pending = {}
+        self.latencies = collections.deque(maxlen=history)
+        self.counts = {'requests': 0, 'search': 0, 'coalesced': 0, 'cache': 0, 'errors': 0}
+
+    async def start(self):
+        """
+        Start every worker process, so the first requests do not wait for them.
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)))
+
+    async def handle(self, request):
+        """
+        Answer one request.
+
+        Args:
+            request (dict): A position (see parse_position) with an optional 'id',
+                'depth' and 'time_ms', or {'stats': true} for the server statistics.
+
+        Returns:
+            dict: The request's id with the answer (see _search), its source
+            ('search', 'coalesced' or 'cache') and its latency, or with an 'error'.
+        """
+        start = time.perf_counter()
+        response = {'id': request.get('id')} if isinstance(request, dict) else {'id': None}
+        if isinstance(request, dict) and request.get('stats'):
+            return dict(response, **self.stats())
+        self.counts['requests'] += 1
+        try:
+            board = parse_position(request)
+            depth = request.get('depth', self.depth)
+            time_ms = request.get('time_ms', self.time_ms)
+            key = (board.size, board.win_length, board.bitboards[1], board.bitboards[2], depth, time_ms)
+            if key in self.answers:
+                self.answers.move_to_end(key)
+                answer, source = self.answers[key], 'cache'
+            elif key in self.pending:
+                answer, source = await self.pending[key], 'coalesced'
+            else:
+                answer, source = await self.search(key, board, depth, time_ms), 'search'
+        except Exception as error:
+            self.counts['errors'] += 1
+            return dict(response, error=f"{type(error).__name__}: {error}")
+        self.counts[source] += 1
+        latency = (time.perf_counter() - start) * 1000
+        self.latencies.append(latency)
+        return dict(response, **answer, source=source, latency_ms=round(latency, 3))
+
+    async def search(self, key, board, depth, time_ms):
+        """
+        Search a position in the pool, letting identical requests wait for the same result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, _search, board.size, board.win_length, board.moves,
+                                      depth, time_ms)
+        self.pending[key] = future
+        try:
+            answer = await future
+        finally:
+            del self.pending[key]
+        self.answers[key] = answer
+        if len(self.answers) > self.cache_size:
+            self.answers.popitem(last=False)
+        return answer
+
+    def stats(self):
+        """
+        Get the request counts and the latency percentiles in milliseconds.
+        """
+        return dict(self.counts, latency_ms=percentiles(self.latencies))
+
+    async def serve(self, reader, writer):
+        """
+        Answer the JSON lines requests of one client until it closes the connection.
+
+        Requests are handled concurrently, so answers can come back in a
+        different order than the requests; clients match them by 'id'.
+        """
+        tasks = set()
+        while line := await reader.readline():
+            if line.strip():
+                task = asyncio.create_task(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        writer.close()
+
+    async def respond(self, line, writer):
+        """
+        Handle one request line and write its answer.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            self.counts['errors'] += 1
+            response = {'id': None, 'error': f"invalid JSON: {error}"}
+        else:
+            response = await self.handle(request)
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        """
+        self.executor.shutdown(cancel_futures=True)
+
+
+class StdioStream:
+    """
+    Stand in for the reader and writer of a connection on stdin and stdout.
+
+    Lines are read in a thread, so stdin and stdout can be pipes, files or a terminal.
+    """
+
+    async def readline(self):
+        """
+        Read a line from stdin, or b'' at the end.
+        """
+        return await asyncio.to_thread(sys.stdin.buffer.readline)
+
+    def write(self, data):
+        """
+        Write to stdout right away.
+        """
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    async def drain(self):
+        """
+        Do nothing; write has already flushed.
+        """
+
+    def close(self):
+        """
+        Do nothing; stdout stays open for the final statistics.
+        """
+
+
+async def run(args):
+    """
+    Serve over stdin/stdout, or over TCP if a port is given.
+    """
+    server = EngineServer(args.workers, args.depth, args.time_ms, args.cache_size, position_cache=args.position_cache)
+    try:
+        await server.start()
+        if args.port is None:
+            stdio = StdioStream()
+            await server.serve(stdio, stdio)
+        else:
+            tcp = await asyncio.start_server(server.serve, args.host, args.port)
+            host, port = tcp.sockets[0].getsockname()[:2]
+            print(f"Listening on {host}:{port}", file=sys.stderr, flush=True)
+            async with tcp:
+                await tcp.serve_forever()
+    finally:
+        print(json.dumps(server.stats()), file=sys.stderr)
+        server.close()
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line.
+    """
+    parser = argparse.ArgumentParser(description="Serve best moves as JSON lines over stdin/stdout or TCP.")
+    parser.add_argument('--port', type=int, default=None, help="TCP port to listen on, 0 for any; stdin/stdout if not given")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, the CPU count by default")
+    parser.add_argument('--depth', type=int, default=4, help="search depth of requests without one")
+    parser.add_argument('--time-ms', type=float, default=None,
+                        help="time budget per request without one, instead of a fixed depth")
+    parser.add_argument('--cache-size', type=int, default=100000, help="answers kept for repeated positions")
+    parser.add_argument('--position-cache', default=None, help="persistent position cache file shared by the workers")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Run the engine server from the command line.
+    """
+    try:
+        asyncio.run(run(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
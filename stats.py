@@ -0,0 +1,98 @@
+class SearchStats:
+    def __init__(self):
+        """
+        Initialize empty statistics for one AI move.
+
+        The counters cover the whole move, including every iteration of an
+        iterative deepening search. self.iterations holds one dict per
+        completed depth with its move, score, nodes and time.
+        """
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.cutoffs = 0
+        self.researches = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.time_ms = 0.0
+        self.iterations = []
+        self.book = False
+        self.cache = False
+        self.solved = False
+
+    @property
+    def depth(self):
+        """
+        The deepest completed search depth, 0 if the move came from the book.
+        """
+        return self.iterations[-1]['depth'] if self.iterations else 0
+
+    @property
+    def ebf(self):
+        """
+        The effective branching factor of the deepest iteration: the d-th root of its nodes at depth d.
+        """
+        if not self.iterations:
+            return 0.0
+        last = self.iterations[-1]
+        return last['nodes'] ** (1 / last['depth']) if last['depth'] else 0.0
+
+    @property
+    def nodes_per_sec(self):
+        """
+        The search speed over the whole move.
+        """
+        return self.nodes / self.time_ms * 1000 if self.time_ms else 0.0
+
+    def add_iteration(self, depth, move, score, nodes, time_ms):
+        """
+        Record a completed search depth.
+
+        Args:
+            depth (int): The depth searched.
+            move (tuple): The best move found.
+            score (float): Its score for the player to move.
+            nodes (int): The nodes searched in this iteration.
+            time_ms (float): The time the iteration took.
+        """
+        self.iterations.append({'depth': depth, 'move': move, 'score': score, 'nodes': nodes, 'time_ms': time_ms})
+
+    def collect(self, minimax, time_ms):
+        """
+        Take the totals of the counters of a finished search.
+
+        Args:
+            minimax (MiniMax): The search, with the counters of this move.
+            time_ms (float): The time the whole move took.
+        """
+        self.nodes = minimax.nodes
+        self.leaf_evals = minimax.leaf_evals
+        self.cutoffs = minimax.cutoffs
+        self.researches = minimax.researches
+        self.tt_hits = minimax.tt_hits
+        self.tt_cutoffs = minimax.tt_cutoffs
+        self.time_ms = time_ms
+
+    def as_dict(self):
+        """
+        Get the statistics as a JSON-friendly dict.
+        """
+        return {
+            'nodes': self.nodes,
+            'leaf_evals': self.leaf_evals,
+            'cutoffs': self.cutoffs,
+            'researches': self.researches,
+            'tt_hits': self.tt_hits,
+            'tt_cutoffs': self.tt_cutoffs,
+            'time_ms': round(self.time_ms, 3),
+            'nodes_per_sec': round(self.nodes_per_sec),
+            'depth': self.depth,
+            'ebf': round(self.ebf, 3),
+            'book': self.book,
+            'cache': self.cache,
+            'solved': self.solved,
+            'iterations': [dict(iteration, time_ms=round(iteration['time_ms'], 3)) for iteration in self.iterations],
+        }
+
+    def __repr__(self):
+        return (f"SearchStats(depth={self.depth}, nodes={self.nodes}, leaf_evals={self.leaf_evals}, "
+                f"cutoffs={self.cutoffs}, tt_hits={self.tt_hits}, ebf={self.ebf:.2f}, time_ms={self.time_ms:.1f})")
@@ -1,6 +1,42 @@
 import unittest
-from ai import AI, MiniMax
+from ai import AI, MiniMax, WIN_SCORE, is_win_score
+import bench
+from board import Board, symmetries
+from book import FLAG_EXACT, OpeningBook, book_key, write_book
+import build_book
+from build_book import WIN, solve
+from endgame import EndgameSolver
+from evaluation import evaluate_batch, stack_boards
+from game import Game, figure_surface
+import loadtest
+import main
+from mcts import MCTS
+from ordering import HeuristicOrdering, MoveOrdering
+import parallel
+from parallel import ParallelSearch
+from position_cache import PositionCache
+from records import RecordWriter, read_records
+import selfplay
+from selfplay import parse_args, play_game
+from server import EngineServer, parse_position
+from thinker import Thinker
+from transposition import EXACT, TranspositionTable
 import numpy as np
+import asyncio
+import pygame
+from constants import CROSS_COLOR, HEIGHT, WIDTH
+import contextlib
+import io
+import itertools
+import math
+import multiprocessing
+import random
+import os
+import subprocess
+import tempfile
+import threading
+import sys
+import time
 
 class MockBoard:
     def __init__(self, size):
@@ -64,5 +100,853 @@ class TestAI(unittest.TestCase):
         move = self.ai.eval(self.board, None)
         self.assertEqual(move, (2, 2))
 
+    def test_time_budget(self):
+        """Test that a time-budgeted search returns a valid move within its budget."""
+        board = Board(6, 100)
+        board.mark_sqr(2, 2, 1)
+        start = time.perf_counter()
+        move = self.ai.eval(board, None, time_budget_ms=200)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertIn(move, board.get_empty_sqrs())
+        self.assertEqual(board.moves, [(2, 2)])
+        self.assertGreater(self.ai.minimax.max_depth, 1)
+
+    def test_large_board_blocks(self):
+        """Test that on a 5-in-a-row board the AI blocks a four within its radius."""
+        board = Board(15, 40, 5)
+        for col, o_square in zip(range(5, 9), [(7, 4), (0, 0), (0, 14)]):
+            board.mark_sqr(7, col, 1)
+            board.mark_sqr(*o_square, 2)
+        board.mark_sqr(7, 8, 1)
+        self.assertEqual(self.ai.eval(board, None, time_budget_ms=300), (7, 9))
+
+    def test_search_stats(self):
+        """Test that eval returns consistent statistics and prints nothing."""
+        board = Board(4, 150)
+        board.mark_sqr(1, 1, 1)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            move, stats = self.ai.eval(board, None, time_budget_ms=100, return_stats=True)
+        self.assertEqual(out.getvalue(), '')
+        self.assertIs(stats, self.ai.last_stats)
+        self.assertEqual(stats.iterations[-1]['move'], move)
+        self.assertEqual([it['depth'] for it in stats.iterations], list(range(1, stats.depth + 1)))
+        self.assertGreaterEqual(stats.nodes, sum(it['nodes'] for it in stats.iterations))
+        self.assertLess(stats.leaf_evals, stats.nodes)
+        self.assertGreater(stats.cutoffs, 0)
+        self.assertGreater(stats.ebf, 1)
+
+    def test_other_win_length_leaves_no_trace(self):
+        """Test that an AI answers a position as a fresh one would after searching it under another win length."""
+        for size, squares in ((5, [6, 8, 21, 13]), (6, [15, 2, 19, 0, 4])):
+            boards = [Board(size, 0, win_length) for win_length in (4, size)]
+            for board in boards:
+                for i, idx in enumerate(squares):
+                    board.mark_sqr(*divmod(idx, size), 1 + i % 2)
+            warm = AI(player=1 + len(squares) % 2, max_depth=3, book=None)
+            fresh = AI(player=warm.player, max_depth=3, book=None)
+            warm.eval(boards[0], None)
+            answer = warm.eval(boards[1], None, return_stats=True)
+            expected = fresh.eval(boards[1], None, return_stats=True)
+            self.assertEqual((answer[0], answer[1].iterations[-1]['score'], answer[1].nodes),
+                             (expected[0], expected[1].iterations[-1]['score'], expected[1].nodes))
+
+    def test_trace_hook(self):
+        """Test that tracing reports each scored move within the traced plies."""
+        traced = []
+        minimax = MiniMax(max_depth=2, trace=1, on_trace=lambda *args: traced.append(args))
+        board = Board(3, 200)
+        board.mark_sqr(1, 1, 1)
+        minimax.negamax(board, -float('inf'), float('inf'), 0, 2)
+        self.assertEqual(sorted(move for _, _, move, _ in traced), sorted(board.unique_moves()))
+        self.assertTrue(all(depth == 0 and player == 2 for depth, player, _, _ in traced))
+
+class TestNegamax(unittest.TestCase):
+    def test_plays_quickest_win(self):
+        """Test that an immediate win is preferred to a slower forced win searched first."""
+        board = Board(3, 200)
+        for i, square in enumerate(((0, 2), (0, 1), (1, 1), (0, 0))):
+            board.mark_sqr(*square, 1 + i % 2)
+        minimax = MiniMax(max_depth=9, ordering=MoveOrdering())
+        self.assertEqual(minimax.negamax(board, -float('inf'), float('inf'), 0, 1), [(2, 0), WIN_SCORE - 1])
+
+    def test_scores_match_exact_solution(self):
+        """Test that full-depth scores give the exact result and distance to the end of the game."""
+        rng = random.Random(5)
+        for _ in range(40):
+            board = Board(3, 200)
+            while board.marked_sqrs < rng.randint(0, 6) and not board.winner():
+                board.mark_sqr(*rng.choice(board.get_empty_sqrs()), 1 + board.marked_sqrs % 2)
+            if board.winner():
+                continue
+            player = 1 + board.marked_sqrs % 2
+            exact = solve(board, player, {})
+            _, score = MiniMax(max_depth=9).negamax(board, -float('inf'), float('inf'), 0, player)
+            # solve scores a win WIN less the marks on the board at the end, negamax WIN_SCORE less the plies to it.
+            plies = WIN - abs(exact) - board.marked_sqrs
+            self.assertEqual(score, 0 if exact == 0 else (WIN_SCORE - plies) * (1 if exact > 0 else -1))
+
+class TestBoard(unittest.TestCase):
+    def test_final_state_lines(self):
+        """Test that rows, columns and both diagonals are detected as wins."""
+        for cells in ([(1, c) for c in range(4)], [(r, 2) for r in range(4)],
+                      [(i, i) for i in range(4)], [(i, 3 - i) for i in range(4)]):
+            board = Board(4, 150)
+            for row, col in cells:
+                board.mark_sqr(row, col, 2)
+            self.assertEqual(board.final_state(), 2)
+
+    def test_matches_squares_grid(self):
+        """Test that the bitboards agree with the squares grid view."""
+        board = Board(3, 200)
+        board.mark_sqr(0, 1, 1)
+        board.mark_sqr(2, 2, 2)
+        self.assertEqual(board.squares.tolist(), [[0, 1, 0], [0, 0, 0], [0, 0, 2]])
+        self.assertFalse(board.empty_sqr(0, 1))
+        self.assertEqual(board.get_empty_sqrs(), [(0, 0), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0), (2, 1)])
+        self.assertEqual(board.final_state(), 0)
+
+    def test_hash_is_move_order_independent(self):
+        """Test that transposed move orders give the same Zobrist hash."""
+        first, second = Board(4, 150), Board(4, 150)
+        for board, moves in ((first, [(0, 0), (1, 1), (2, 2)]), (second, [(2, 2), (1, 1), (0, 0)])):
+            for (row, col), player in zip(moves, (1, 2, 1)):
+                board.mark_sqr(row, col, player)
+        self.assertEqual(first.hash, second.hash)
+        first.mark_sqr(3, 3, 2)
+        self.assertNotEqual(first.hash, second.hash)
+
+    def test_hash_depends_on_win_length(self):
+        """Test that the same marks under different win lengths hash differently."""
+        boards = [Board(5, 0, win_length) for win_length in (3, 4, 5)]
+        for board in boards:
+            board.mark_sqr(2, 2, 1)
+        self.assertEqual(len({board.hash for board in boards}), 3)
+        self.assertEqual(len({board.canonical_hash()[0] for board in boards}), 3)
+
+    def test_unmark_restores_position(self):
+        """Test that unmark_sqr undoes mark_sqr exactly."""
+        board = Board(3, 200)
+        board.mark_sqr(1, 1, 1)
+        before = (board.bitboards[:], board.hash, board.marked_sqrs)
+        board.mark_sqr(0, 2, 2)
+        board.unmark_sqr(0, 2)
+        self.assertEqual((board.bitboards, board.hash, board.marked_sqrs), before)
+
+    def test_incremental_winner(self):
+        """Test that the winner follows the line counters through mark and unmark."""
+        board = Board(3, 200)
+        for col in range(3):
+            board.mark_sqr(1, col, 1)
+        self.assertEqual(board.winner(), 1)
+        self.assertEqual(board.last_move, (1, 2))
+        self.assertEqual(board.winning_line()[:2], ('row', 1))
+        board.unmark_sqr(1, 2)
+        self.assertEqual(board.winner(), 0)
+        self.assertEqual(board.last_move, (1, 1))
+
+    def test_incremental_line_score(self):
+        """Test that the running line score matches a count from scratch."""
+        def recount(squares):
+            size = len(squares)
+            lines = [squares[r] for r in range(size)] + [squares[:, c] for c in range(size)]
+            lines += [squares.diagonal(), np.fliplr(squares).diagonal()]
+            x_score = sum(4 * list(line).count(1) for line in lines if 2 not in line)
+            o_score = sum(4 * list(line).count(2) for line in lines if 1 not in line)
+            return x_score - o_score
+
+        rng = random.Random(0)
+        board = Board(5, 120)
+        cells = [(r, c) for r in range(5) for c in range(5)]
+        rng.shuffle(cells)
+        for i, (row, col) in enumerate(cells):
+            board.mark_sqr(row, col, 1 + i % 2)
+            self.assertEqual(board.line_score, recount(board.squares))
+            if i % 3 == 2:
+                board.unmark_sqr(row, col)
+                self.assertEqual(board.line_score, recount(board.squares))
+                board.mark_sqr(row, col, 1 + i % 2)
+
+    def test_incremental_threats(self):
+        """Test that the tracked threat squares match a scan of every line through marks and undos."""
+        def scan(board, player):
+            squares = []
+            for _, _, mask in board.lines:
+                own, theirs = mask & board.bitboards[player], mask & board.bitboards[3 - player]
+                if not theirs and bin(own).count('1') == board.win_length - 1:
+                    squares.append(divmod((mask & ~own).bit_length() - 1, board.size))
+            return squares
+
+        rng = random.Random(2)
+        for size, win_length in ((4, 3), (7, 4)):
+            board = Board(size, 0, win_length)
+            for i in range(size * size - 1):
+                board.mark_sqr(*rng.choice(board.get_empty_sqrs()), 1 + i % 2)
+                if i % 3 == 2:
+                    board.unmark_sqr(*rng.choice(board.moves))
+                    board.mark_sqr(*rng.choice(board.get_empty_sqrs()), 1 + i % 2)
+                for player in (1, 2):
+                    self.assertEqual(board.threat_squares(player), scan(board, player))
+                    self.assertEqual(board.copy().threat_squares(player), scan(board, player))
+
+    def test_symmetric_hashes(self):
+        """Test that the incremental symmetric hashes match the transformed boards."""
+        board = Board(4, 150)
+        for (row, col), player in zip([(0, 1), (2, 3), (1, 1)], (1, 2, 1)):
+            board.mark_sqr(row, col, player)
+        for perm, sym_hash in zip(symmetries(4), board.sym_hashes):
+            image = Board(4, 150)
+            for row, col in board.moves:
+                image.mark_sqr(*divmod(perm[row * 4 + col], 4), 2 if board.bitboards[2] >> (row * 4 + col) & 1 else 1)
+            self.assertEqual(image.hash, sym_hash)
+            self.assertEqual(image.canonical_hash()[0], board.canonical_hash()[0])
+
+    def test_unique_moves(self):
+        """Test that moves equivalent by a symmetry of the position are searched once."""
+        board = Board(3, 200)
+        self.assertEqual(board.unique_moves(), [(0, 0), (0, 1), (1, 1)])
+        board.mark_sqr(0, 0, 1)
+        self.assertEqual(board.unique_moves(), [(0, 1), (0, 2), (1, 1), (1, 2), (2, 2)])
+        self.assertEqual(board.unique_move(1, 0), (0, 1))
+        board.mark_sqr(0, 1, 2)
+        self.assertEqual(board.unique_moves(), board.get_empty_sqrs())
+
+    def test_win_length(self):
+        """Test that k in a row wins anywhere on a larger board and fewer does not."""
+        board = Board(9, 66, 5)
+        self.assertEqual(len(board.lines), 2 * 9 * 5 + 2 * 5 * 5)
+        for i in range(4):
+            board.mark_sqr(2 + i, 6 - i, 2)
+        self.assertEqual(board.winner(), 0)
+        board.mark_sqr(6, 2, 2)
+        self.assertEqual(board.winner(), 2)
+        self.assertEqual(board.winning_line()[0], 'anti')
+        board.unmark_sqr(4, 4)
+        self.assertEqual(board.winner(), 0)
+
+    def test_nearby_squares(self):
+        """Test that move generation by radius stays on the board and near the marks."""
+        board = Board(7, 85, 5)
+        self.assertEqual(board.get_nearby_sqrs(2), [(3, 3)])
+        board.mark_sqr(0, 6, 1)
+        self.assertEqual(board.get_nearby_sqrs(1), [(0, 5), (1, 5), (1, 6)])
+        board.mark_sqr(3, 0, 2)
+        self.assertEqual(sorted(board.get_nearby_sqrs(1)),
+                         [(0, 5), (1, 5), (1, 6), (2, 0), (2, 1), (3, 1), (4, 0), (4, 1)])
+        self.assertEqual(len(board.get_nearby_sqrs(6)), 47)
+
+    def test_core_imports_without_pygame_or_numpy(self):
+        """Test that the rules and search load neither pygame nor NumPy."""
+        code = ("import sys, ai, board; ai.AI(player=2).eval(board.Board(3)); "
+                "print(sorted({'pygame', 'numpy'} & set(sys.modules)))")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.stdout.strip(), '[]')
+
+    def test_search_leaves_board_unchanged(self):
+        """Test that negamax undoes every move it makes on the shared board."""
+        board = Board(4, 150)
+        board.mark_sqr(1, 1, 1)
+        before = (board.bitboards[:], board.hash, board.marked_sqrs)
+        MiniMax(max_depth=3).negamax(board, -float('inf'), float('inf'), 0, 2)
+        self.assertEqual((board.bitboards, board.hash, board.marked_sqrs), before)
+
+class TestBatchEvaluation(unittest.TestCase):
+    def test_matches_line_score(self):
+        """Test that the batched scores equal each board's incremental line score."""
+        rng = random.Random(1)
+        for size in (3, 4, 5):
+            boards = []
+            for _ in range(50):
+                board = Board(size, 0)
+                cells = [(r, c) for r in range(size) for c in range(size)]
+                for i, (row, col) in enumerate(rng.sample(cells, rng.randrange(len(cells) + 1))):
+                    board.mark_sqr(row, col, 1 + i % 2)
+                boards.append(board)
+            scores = evaluate_batch(stack_boards(boards))
+            self.assertEqual(scores.tolist(), [board.line_score for board in boards])
+
+    def test_matches_windowed_line_score(self):
+        """Test that the batched scores follow the board's win length."""
+        rng = random.Random(2)
+        boards = []
+        for _ in range(30):
+            board = Board(8, 0, 4)
+            cells = [(r, c) for r in range(8) for c in range(8)]
+            for i, (row, col) in enumerate(rng.sample(cells, rng.randrange(30))):
+                board.mark_sqr(row, col, 1 + i % 2)
+            boards.append(board)
+        scores = evaluate_batch(stack_boards(boards), 4)
+        self.assertEqual(scores.tolist(), [board.line_score for board in boards])
+
+class TestOpeningBook(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        records = {}
+        solve(Board(3, 0), 1, records)
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.dir.name, 'book.bin')
+        write_book(cls.path, records)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def test_canonical_is_symmetry_invariant(self):
+        """Test that every rotation and reflection of a position has the same canonical key."""
+        board = Board(4, 150)
+        for (row, col), player in zip([(0, 1), (2, 3), (1, 1)], (1, 2, 1)):
+            board.mark_sqr(row, col, player)
+        keys = set()
+        for perm in symmetries(4):
+            image = Board(4, 150)
+            for idx in range(16):
+                if board.bitboards[1] >> idx & 1:
+                    image.mark_sqr(*divmod(perm[idx], 4), 1)
+                if board.bitboards[2] >> idx & 1:
+                    image.mark_sqr(*divmod(perm[idx], 4), 2)
+            keys.add(image.canonical()[0])
+        self.assertEqual(len(keys), 1)
+
+    def test_book_moves_in_every_orientation(self):
+        """Test that the book takes the win in each orientation of a position."""
+        book = OpeningBook(self.path)
+        for perm in symmetries(3):
+            board = Board(3, 200)
+            for (row, col), player in zip([(0, 0), (1, 1), (0, 1), (2, 2)], (1, 2, 1, 2)):
+                board.mark_sqr(*divmod(perm[row * 3 + col], 3), player)
+            self.assertEqual(book.lookup(board, 1), divmod(perm[2], 3))
+        self.assertIsNone(book.lookup(board, 2))
+        book.close()
+
+    def test_solved_values(self):
+        """Test that the empty 3x3 board is a draw and the AI plays from the book."""
+        book = OpeningBook(self.path)
+        board = Board(3, 200)
+        record = book.probe(book_key(3, board.canonical()[0]))
+        self.assertEqual(record[1:], (FLAG_EXACT, 0))
+        book.close()
+        ai = AI(player=2, book=self.path)
+        board.mark_sqr(0, 0, 1)
+        self.assertEqual(ai.eval(board, None), (1, 1))
+        self.assertEqual(ai.minimax.nodes, 0)
+        ai.close()
+
+    def test_rejects_boards_too_large_for_keys(self):
+        """Test that boards whose bitboards overflow a record key are refused rather than mixed up."""
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            build_book.parse_args(['--sizes', '7'])
+        self.assertEqual(build_book.parse_args(['--sizes', '4', '5']).sizes, [4, 5])
+        with self.assertRaises(ValueError):
+            book_key(6, 0)
+        book = OpeningBook(self.path)
+        board = Board(6, 100)
+        board.mark_sqr(5, 5, 1)
+        self.assertIsNone(book.lookup(board, 2))
+        book.close()
+
+class TestPositionCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'positions.db')
+
+    def test_answers_symmetric_position_without_search(self):
+        """Test that a position searched by one AI is answered from the file for a rotation of it."""
+        board = Board(4, 150)
+        board.mark_sqr(0, 1, 1)
+        first = AI(player=2, cache=self.path)
+        move = first.eval(board)
+        first.close()
+        perm = symmetries(4)[3]
+        rotated = Board(4, 150)
+        rotated.mark_sqr(*divmod(perm[1], 4), 1)
+        second = AI(player=2, cache=self.path)
+        rotated_move, stats = second.eval(rotated, return_stats=True)
+        second.close()
+        self.assertTrue(stats.cache)
+        self.assertEqual(stats.nodes, 0)
+        self.assertEqual(rotated_move, divmod(perm[move[0] * 4 + move[1]], 4))
+
+    def test_time_budget_searches_past_cache(self):
+        """Test that a time-budgeted AI deepens past a shallow cached result instead of playing it."""
+        board = Board(4, 150)
+        board.mark_sqr(1, 1, 1)
+        shallow = AI(player=2, max_depth=2, book=None, cache=self.path)
+        shallow.eval(board)
+        shallow.close()
+        timed = AI(player=2, max_depth=2, time_budget_ms=300, book=None, cache=self.path)
+        _, stats = timed.eval(board, return_stats=True)
+        timed.close()
+        self.assertTrue(stats.cache)
+        self.assertEqual([it['depth'] for it in stats.iterations], list(range(2, stats.depth + 1)))
+        self.assertGreater(stats.depth, 2)
+        self.assertGreater(stats.nodes, 0)
+
+    def test_time_budget_starts_from_deep_cache_entry(self):
+        """Test that a time-budgeted AI plays a cached result deeper than its budget reaches."""
+        board = Board(4, 150)
+        board.mark_sqr(1, 1, 1)
+        deep = AI(player=2, max_depth=6, book=None, cache=self.path)
+        move = deep.eval(board)
+        deep.close()
+        timed = AI(player=2, time_budget_ms=5, book=None, cache=self.path)
+        timed_move, stats = timed.eval(board, return_stats=True)
+        timed.close()
+        self.assertTrue(stats.cache)
+        self.assertEqual(timed_move, move)
+        self.assertEqual(stats.iterations[0]['depth'], 6)
+        self.assertGreaterEqual(stats.depth, 6)
+
+    def test_keeps_deeper_results_and_evicts(self):
+        """Test that shallower results do not overwrite deeper ones and the oldest entries go first."""
+        cache = PositionCache(self.path, max_entries=3)
+        boards = []
+        for square in ((0, 0), (0, 1), (0, 2), (1, 1), (1, 2)):
+            board = Board(5, 120)
+            board.mark_sqr(*square, 1)
+            boards.append(board)
+            cache.store(board, 2, 4, 10, (4, 4))
+        cache.store(boards[-1], 2, 2, -10, (3, 3))
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.probe(boards[0], 2))
+        self.assertEqual(cache.probe(boards[-1], 2), (4, 10, (4, 4)))
+        self.assertIsNone(cache.probe(boards[-1], 1))
+        cache.close()
+
+    def test_probes_only_read_and_recency_still_counts(self):
+        """Test that probes write nothing themselves and their hits are kept over older entries."""
+        cache = PositionCache(self.path, max_entries=20)
+        boards, keys = [], set()
+        for first, second in itertools.combinations(range(25), 2):
+            board = Board(5, 120)
+            board.mark_sqr(*divmod(first, 5), 1)
+            board.mark_sqr(*divmod(second, 5), 2)
+            if len(boards) < 20 and board.canonical_hash()[0] not in keys:
+                keys.add(board.canonical_hash()[0])
+                boards.append(board)
+                cache.store(board, 1, 4, 0, (2, 2))
+        self.assertIsNotNone(cache.probe(boards[0], 1))
+        self.assertFalse(cache.db.in_transaction)
+        cache.store(boards[-1], 2, 4, 0, (2, 2))
+        self.assertEqual(len(cache), 18)
+        self.assertIsNotNone(cache.probe(boards[0], 1))
+        self.assertIsNone(cache.probe(boards[1], 1))
+        cache.close()
+
+class TestEndgame(unittest.TestCase):
+    def brute_force(self, board, player):
+        """Score a position for the player to move by trying every line of play."""
+        best = -float('inf')
+        empties = board.get_empty_sqrs()
+        for row, col in empties:
+            board.mark_sqr(row, col, player)
+            if board.wins[player]:
+                score = len(empties)
+            elif len(empties) == 1:
+                score = 0
+            else:
+                score = -self.brute_force(board, 3 - player)
+            board.unmark_sqr(row, col)
+            best = max(best, score)
+        return best
+
+    def test_matches_brute_force(self):
+        """Test that the solver's scores are exact and its moves achieve them on random endgames."""
+        rng = random.Random(1)
+        solver = EndgameSolver()
+        for _ in range(60):
+            size = rng.choice([3, 4])
+            board = Board(size, 0, rng.choice([3, size]))
+            while board.marked_sqrs < size * size - rng.randint(1, 7) and not board.winner():
+                board.mark_sqr(*rng.choice(board.get_empty_sqrs()), 1 + board.marked_sqrs % 2)
+            if board.winner() or board.isfull():
+                continue
+            player = 1 + board.marked_sqrs % 2
+            moves = list(board.moves)
+            move, score = solver.solve(board, player)
+            self.assertEqual(board.moves, moves)
+            self.assertEqual(score, self.brute_force(board, player))
+            board.mark_sqr(*move, player)
+            after = 1 + size * size - board.marked_sqrs if board.wins[player] else (
+                0 if board.isfull() else -self.brute_force(board, 3 - player))
+            self.assertEqual(after, score)
+
+    def test_ai_solves_late_positions(self):
+        """Test that the AI solves positions with few empty squares and searches the rest."""
+        board = Board(4, 150)
+        for i, square in enumerate(((0, 0), (1, 1), (0, 1), (2, 2), (3, 3), (0, 2), (1, 0), (2, 0))):
+            board.mark_sqr(*square, 1 + i % 2)
+        move, stats = AI(player=1, book=None).eval(board, return_stats=True)
+        self.assertTrue(stats.solved)
+        self.assertEqual(stats.depth, 8)
+        self.assertEqual(stats.nodes, stats.iterations[-1]['nodes'])
+        self.assertEqual(stats.iterations[-1]['score'], self.brute_force(board, 1))
+        self.assertTrue(board.empty_sqr(*move))
+        _, stats = AI(player=1, book=None, endgame=0).eval(board, return_stats=True)
+        self.assertFalse(stats.solved)
+
+    def test_solver_overrides_position_cache(self):
+        """Test that a cached heuristic result does not stand in for an exact solve."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'positions.db')
+        board = Board(4, 150)
+        for i, square in enumerate(((0, 0), (1, 1), (0, 1), (2, 2), (3, 3), (0, 2), (1, 0), (2, 0))):
+            board.mark_sqr(*square, 1 + i % 2)
+        searched = AI(player=1, book=None, endgame=0, cache=path)
+        searched.eval(board)
+        searched.close()
+        solver = AI(player=1, book=None, cache=path)
+        _, stats = solver.eval(board, return_stats=True)
+        solver.close()
+        self.assertTrue(stats.solved)
+        self.assertFalse(stats.cache)
+
+class TestBench(unittest.TestCase):
+    def test_positions_are_fixed(self):
+        """Test that benchmark positions are the same on every call and still open."""
+        for phase in bench.PHASES:
+            first, second = bench.make_position(5, phase), bench.make_position(5, phase)
+            self.assertEqual(first.moves, second.moves)
+            self.assertEqual(first.winner(), 0)
+
+    def test_compare_flags_slowdowns(self):
+        """Test that compare reports slower or bigger searches beyond the threshold only."""
+        old = {'size': 4, 'phase': 'mid', 'depth': 6, 'time_ms': 100.0, 'eval_ns': 50.0, 'nodes': 1000, 'move': [1, 1]}
+        new = dict(old, time_ms=105.0, nodes=1500)
+        regressions = bench.compare({'results': [old]}, {'results': [new]}, 0.1)
+        self.assertEqual(regressions, ['4x4 mid: nodes 1000 -> 1500'])
+        self.assertEqual(bench.compare({'results': [old]}, {'results': [dict(new, depth=7)]}, 0.1), [])
+
+class TestMCTS(unittest.TestCase):
+    def test_takes_win_and_blocks(self):
+        """Test that MCTS wins on the spot when it can and blocks when it must."""
+        board = Board(3, 200)
+        for row, col, player in ((0, 0, 1), (1, 1, 2), (0, 1, 1)):
+            board.mark_sqr(row, col, player)
+        self.assertEqual(MCTS(seed=0).search(board, 2, playouts=200)[0], (0, 2))
+        board.mark_sqr(2, 2, 2)
+        self.assertEqual(MCTS(seed=0).search(board, 1, playouts=200), ((0, 2), 1.0))
+
+    def test_playout_budget(self):
+        """Test that the search runs exactly its playouts and leaves the board as it was."""
+        board = Board(4, 150)
+        board.mark_sqr(1, 1, 1)
+        mcts = MCTS(seed=0)
+        move, reward = mcts.search(board, 2, playouts=300)
+        self.assertEqual(mcts.playouts, 300)
+        self.assertTrue(board.empty_sqr(*move))
+        self.assertTrue(0 <= reward <= 1)
+        self.assertEqual(board.moves, [(1, 1)])
+        reference = Board(4, 150)
+        reference.mark_sqr(1, 1, 1)
+        self.assertEqual((board.hash, board.bitboards), (reference.hash, reference.bitboards))
+
+    def test_ai_engine(self):
+        """Test that the AI uses MCTS within its time budget and reports the playouts."""
+        board = Board(7, 80, 5)
+        board.mark_sqr(3, 3, 1)
+        ai = AI(player=2, engine='mcts', time_budget_ms=200)
+        start = time.perf_counter()
+        move, stats = ai.eval(board, None, return_stats=True)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertLessEqual(max(abs(move[0] - 3), abs(move[1] - 3)), 2)
+        self.assertGreater(stats.nodes, 0)
+        self.assertEqual(stats.iterations[-1]['nodes'], stats.nodes)
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_depth_preferred_replacement(self):
+        """Test that a deeper entry survives a collision from the same search only."""
+        table = TranspositionTable(size=4, replacement='depth')
+        table.store(1, 5, 10, EXACT, (0, 0))
+        table.store(5, 2, 20, EXACT, (1, 1))
+        self.assertIsNotNone(table.probe(1))
+        self.assertIsNone(table.probe(5))
+        table.new_search()
+        table.store(5, 2, 20, EXACT, (1, 1))
+        self.assertEqual(table.probe(5)[2], 20)
+        self.assertIsNone(table.probe(1))
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_winning_and_blocking_moves_first(self):
+        """Test that a winning move is ordered before a block, and both before the rest."""
+        board = Board(3, 200)
+        board.mark_sqr(0, 0, 2)
+        board.mark_sqr(0, 1, 2)
+        board.mark_sqr(2, 0, 1)
+        board.mark_sqr(2, 1, 1)
+        moves = HeuristicOrdering().order(board, board.get_empty_sqrs(), 2, 0)
+        self.assertEqual(moves[:2], [(0, 2), (2, 2)])
+
+    def test_fewer_nodes_than_row_major(self):
+        """Test that heuristic ordering finds the same score with fewer nodes."""
+        board = Board(4, 150)
+        board.mark_sqr(0, 1, 1)
+        board.mark_sqr(2, 2, 2)
+        board.mark_sqr(3, 0, 1)
+        results = []
+        for ordering in (MoveOrdering(), HeuristicOrdering()):
+            minimax = MiniMax(max_depth=5, ordering=ordering)
+            _, score = minimax.negamax(board, -float('inf'), float('inf'), 0, 2)
+            results.append((minimax.nodes, score))
+        self.assertEqual(results[0][1], results[1][1])
+        self.assertLess(results[1][0], results[0][0])
+
+class TestParallelSearch(unittest.TestCase):
+    def test_matches_serial_search(self):
+        """Test that the parallel root search returns the serial move and score."""
+        parallel = ParallelSearch(workers=2)
+        try:
+            for size, moves in ((3, [(1, 1)]), (4, [(0, 0), (1, 1), (2, 1)]), (5, [(2, 2), (0, 4)])):
+                board = Board(size, 600 // size)
+                for i, (row, col) in enumerate(moves):
+                    board.mark_sqr(row, col, 1 + i % 2)
+                player = 2 if len(moves) % 2 else 1
+                serial = MiniMax(max_depth=4).negamax(board, -float('inf'), float('inf'), 0, player)
+                self.assertEqual(parallel.search(MiniMax(max_depth=4), board, player), serial)
+        finally:
+            parallel.close()
+
+    def test_workers_start_new_search_with_caller(self):
+        """Test that a worker ages its table and ordering once per search of the caller."""
+        class CountingOrdering(HeuristicOrdering):
+            searches = 0
+
+            def new_search(self):
+                self.searches += 1
+                super().new_search()
+
+        parallel._init_worker(multiprocessing.Array('d', [1, -float('inf'), 9]), 1 << 10, 'depth')
+        worker = parallel._minimax
+        worker.ordering = CountingOrdering()
+        board = Board(3, 200)
+        board.mark_sqr(1, 1, 1)
+        seen = []
+        for search in (5, 5, 6):
+            parallel._search_root_move(board.copy(), 2, (0, 0), 0, 3, [], 2, search, 1, None)
+            seen.append((worker.tt.generation, worker.ordering.searches))
+        first = seen[0]
+        self.assertEqual(first[1], 1)
+        self.assertEqual(seen[1], first)
+        self.assertEqual(seen[2], (first[0] + 1, 2))
+
+class TestThinker(unittest.TestCase):
+    def wait_for_move(self, thinker, board):
+        thinker.think(board)
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline:
+            move = thinker.poll()
+            if move is not None:
+                return move
+            time.sleep(0.01)
+        self.fail("The thinker did not answer in time")
+
+    def test_background_move_matches_eval(self):
+        """Test that a background search finds the same move as a direct one."""
+        board = Board(3, 200)
+        board.mark_sqr(0, 0, 1)
+        thinker = Thinker(AI(player=2))
+        self.assertEqual(self.wait_for_move(thinker, board), AI(player=2).eval(board, None))
+        self.assertEqual(board.moves, [(0, 0)])
+
+    def test_pondered_reply_is_answered_from_cache(self):
+        """Test that pondering stores answers for the opponent's replies."""
+        board = Board(3, 200)
+        thinker = Thinker(AI(player=2))
+        thinker.ponder(board)
+        ponder_thread = thinker.thread
+        ponder_thread.join()
+        self.assertEqual(len(thinker.answers), 9)
+        board.mark_sqr(1, 1, 1)
+        thinker.think(board)
+        self.assertIs(thinker.thread, ponder_thread)
+        self.assertEqual(thinker.poll(), thinker.answers[board.hash])
+
+    def test_answer_callback(self):
+        """Test that the thinker reports a finished move through on_answer."""
+        answered = threading.Event()
+        board = Board(3, 200)
+        board.mark_sqr(1, 1, 1)
+        thinker = Thinker(AI(player=2), on_answer=answered.set)
+        thinker.think(board)
+        self.assertTrue(answered.wait(10))
+        self.assertIsNotNone(thinker.poll())
+
+    def test_cancel_stops_search(self):
+        """Test that cancelling abandons a long search quickly."""
+        board = Board(6, 100)
+        thinker = Thinker(AI(player=2, max_depth=8))
+        board.mark_sqr(2, 2, 1)
+        thinker.think(board)
+        start = time.perf_counter()
+        thinker.cancel()
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertIsNone(thinker.poll())
+
+class TestGame(unittest.TestCase):
+    def test_moves_redraw_only_their_square(self):
+        """Test that a move marks just its square dirty and draws the cached figure there."""
+        screen = pygame.Surface((WIDTH, HEIGHT))
+        game = Game(4, screen)
+        self.assertEqual(game.dirty, [screen.get_rect()])
+        game.dirty = []
+        game.make_move(1, 2)
+        square = game.SQUARE_SIZE
+        self.assertEqual(game.dirty, [pygame.Rect(2 * square, square, square, square)])
+        self.assertIs(figure_surface(1, square), figure_surface(1, square))
+        self.assertEqual(screen.get_at((2 * square + square // 2, square + square // 2))[:3], CROSS_COLOR)
+
+    def test_size_input_keeps_every_key(self):
+        """Test that several keys arriving in one batch are all applied."""
+        keys = [pygame.event.Event(pygame.KEYDOWN, key=key, unicode=char)
+                for key, char in ((pygame.K_1, '1'), (pygame.K_2, '2'), (pygame.K_BACKSPACE, ''), (pygame.K_5, '5'))]
+        self.assertEqual(main.handle_input_events('', keys), '15')
+        self.assertEqual(main.handle_input_events('15', [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN, unicode='')]), 15)
+
+class TestServer(unittest.TestCase):
+    def test_coalesces_and_caches(self):
+        """Test that identical requests share one search and repeats come from the cache."""
+        async def scenario():
+            server = EngineServer(workers=1)
+            try:
+                request = {'size': 4, 'moves': [[1, 1]]}
+                first, second = await asyncio.gather(server.handle(dict(request, id=1)),
+                                                     server.handle(dict(request, id=2)))
+                third = await server.handle(dict(request, id=3))
+                error = await server.handle({'id': 4, 'size': 3, 'moves': [[1, 1], [1, 1]]})
+                return first, second, third, error, server.stats()
+            finally:
+                server.close()
+
+        first, second, third, error, stats = asyncio.run(scenario())
+        self.assertEqual([first['source'], second['source'], third['source']], ['search', 'coalesced', 'cache'])
+        self.assertEqual(first['move'], second['move'])
+        self.assertEqual(third['id'], 3)
+        self.assertIn('illegal move', error['error'])
+        self.assertEqual((stats['requests'], stats['search'], stats['errors']), (4, 1, 1))
+
+    def test_win_length_gets_its_own_ai(self):
+        """Test that a worker answers a position as a fresh AI would after searching it under another win length."""
+        moves = [[5, 0], [2, 3]]
+        async def scenario():
+            server = EngineServer(workers=1)
+            try:
+                answers = []
+                for win_length in (4, 6):
+                    answers.append(await server.handle({'id': win_length, 'size': 6, 'win_length': win_length,
+                                                        'moves': moves, 'depth': 4}))
+                return answers
+            finally:
+                server.close()
+
+        _, answer = asyncio.run(scenario())
+        board = parse_position({'size': 6, 'win_length': 6, 'moves': moves})
+        move, stats = AI(player=1, max_depth=4).eval(board, return_stats=True)
+        self.assertEqual(answer['source'], 'search')
+        self.assertEqual((answer['move'], answer['score']), (list(move), stats.iterations[-1]['score']))
+
+    def test_parse_position_rejects_finished_games(self):
+        """Test that moves after a win and full boards are refused."""
+        with self.assertRaises(ValueError):
+            parse_position({'size': 3, 'moves': [[0, 0], [1, 0], [0, 1], [1, 1], [0, 2], [2, 2]]})
+        self.assertEqual(parse_position({'size': 3, 'moves': [[0, 0], [1, 1]]}).marked_sqrs, 2)
+
+    def test_load_test_over_stdio(self):
+        """Test that the load test client plays games against a server it starts."""
+        settings = loadtest.parse_args(['--games', '3', '--concurrency', '2', '--workers', '1'])
+        summary = asyncio.run(loadtest.run(settings))
+        self.assertGreater(summary['requests'], 0)
+        self.assertEqual(sum(summary['sources'].values()), summary['requests'])
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'games.bin')
+
+    def test_round_trip_across_appends(self):
+        """Test that games come back with their header, evals and times, however the file is chunked."""
+        writer = RecordWriter(self.path, 3, config={'engine': 'minimax'})
+        writer.write([(0, 0), (1, 1), (0, 1), (2, 2), (0, 2)], 1, [None, 2.0, WIN_SCORE - 3, -3.5, 7.0],
+                     [0.01, 1.5, 2.25, 0.0, 12.34])
+        writer.close()
+        writer = RecordWriter(self.path, 15, 5, config={'engine': 'mcts'})
+        moves = [(14, 14), (7, 7), (0, 14)]
+        writer.write(moves, 0, swapped=True)
+        writer.close()
+        for chunk_size in (1, 3, 1 << 16):
+            first, second = read_records(self.path, chunk_size)
+            self.assertEqual((first.size, first.win_length, first.config), (3, 3, {'engine': 'minimax'}))
+            self.assertEqual(first.winner, 1)
+            self.assertTrue(math.isnan(first.evals[0]))
+            self.assertEqual(first.evals[1:], [2.0, WIN_SCORE - 3, -3.5, 7.0])
+            self.assertEqual(first.times, [0.01, 1.5, 2.25, 0.0, 12.34])
+            self.assertEqual(first.board().winner(), 1)
+            self.assertEqual([board.marked_sqrs for board in first.replay()], [1, 2, 3, 4, 5])
+            self.assertEqual((second.size, second.win_length, second.config), (15, 5, {'engine': 'mcts'}))
+            self.assertEqual((second.moves, second.winner, second.swapped), (moves, 0, True))
+            self.assertIsNone(second.evals)
+        # File header, two headers, then a game of 5 one-byte moves, 5 evals and 8 bytes of
+        # times, and one of 3 moves with the first past index 127 taking two bytes.
+        self.assertEqual(os.path.getsize(self.path), 6 + (4 + 20) + (2 + 5 + 20 + 8) + (4 + 17) + (2 + 4))
+
+    def test_truncated_and_foreign_files(self):
+        """Test that a half-written last game is skipped and other files are refused."""
+        writer = RecordWriter(self.path, 4)
+        for _ in range(3):
+            writer.write([(0, 0), (1, 1)], 0, times=[1.0, 2.0])
+        writer.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual(len(list(read_records(self.path))), 2)
+        with open(self.path, 'wb') as f:
+            f.write(b'not a record file')
+        with self.assertRaises(ValueError):
+            list(read_records(self.path))
+        with self.assertRaises(ValueError):
+            RecordWriter(self.path, 3)
+
+    def test_selfplay_writes_records(self):
+        """Test that self-play appends every game with its engines, evals and latencies."""
+        with contextlib.redirect_stderr(io.StringIO()):
+            selfplay.main(['--games', '4', '--workers', '1', '--out', os.devnull, '--records', self.path,
+                           '--b-depth', '2'])
+        records = list(read_records(self.path))
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[0].config['b']['depth'], 2)
+        self.assertEqual(sorted(record.swapped for record in records), [False, False, True, True])
+        for record in records:
+            self.assertEqual(record.board().winner(), record.winner)
+            self.assertEqual(len(record.evals), len(record.squares))
+            self.assertEqual(len(record.times), len(record.squares))
+
+    def test_selfplay_records_win_scores(self):
+        """Test that self-play games with forced wins keep their exact win scores."""
+        with contextlib.redirect_stderr(io.StringIO()):
+            selfplay.main(['--games', '2', '--workers', '1', '--out', os.devnull, '--records', self.path,
+                           '--size', '5', '--win-length', '3', '--a-depth', '3', '--b-depth', '1'])
+        evals = [score for record in read_records(self.path) for score in record.evals]
+        wins = [score for score in evals if not math.isnan(score) and is_win_score(score)]
+        self.assertTrue(wins)
+        self.assertTrue(all(score == int(score) for score in wins))
+
+class TestSelfPlay(unittest.TestCase):
+    def test_play_game_record(self):
+        """Test that a self-play game produces a complete, legal record."""
+        settings = parse_args(['--size', '3', '--a-depth', '3', '--b-depth', '1'])
+        record = play_game((1, settings))
+        self.assertEqual(record['a_player'], 2)
+        self.assertIn(record['result'], ('win', 'draw', 'loss'))
+        self.assertEqual(len(record['moves']), len(set(record['moves'])))
+        self.assertEqual(len(record['latency_ms']), len(record['moves']))
+
+    def test_does_not_import_pygame(self):
+        """Test that the headless runner never loads pygame."""
+        code = "import sys, selfplay; selfplay.play_game((0, selfplay.parse_args([]))); print('pygame' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.stdout.strip(), 'False')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
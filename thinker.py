@@ -0,0 +1,132 @@
+import threading
+from ai import SearchAborted
+
+
+class Thinker:
+    def __init__(self, ai, on_answer=None):
+        """
+        Initialize a background thinker that runs the AI's searches off the main loop.
+
+        Args:
+            ai (AI): The AI to search with.
+            on_answer (callable): Called with no arguments from the search thread when
+                the move for the position passed to think is found, so a waiting main loop
+                can wake up and poll.
+        """
+        self.on_answer = on_answer
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = None
+        self.attach(ai)
+
+    def attach(self, ai):
+        """
+        Switch to a new AI, dropping everything found for the old one.
+
+        Args:
+            ai (AI): The AI to search with.
+        """
+        self.cancel()
+        self.ai = ai
+        ai.minimax.stop = self.stop
+        self.wanted = None
+        self.searching = None
+        self.answers = {}
+
+    def think(self, board):
+        """
+        Start finding the AI's move in a position, without waiting for it.
+
+        Nothing new is started if the answer is already known from pondering, or
+        if the position is the one being pondered right now. Calling this again
+        for the same position does nothing, so it is safe to call every frame.
+
+        Args:
+            board (Board): The current game board, with the AI to move.
+        """
+        with self.lock:
+            if self.wanted == board.hash:
+                return
+            self.wanted = board.hash
+            if board.hash in self.answers or board.hash == self.searching:
+                return
+        self.start(self.search, board.copy())
+
+    def ponder(self, board):
+        """
+        Start searching the AI's answers to the opponent's likely replies, without waiting.
+
+        The reply the AI's last search expected comes first, followed by the
+        others in the usual move order. Replies equivalent by symmetry are all
+        searched, since answers are remembered by exact position.
+
+        Args:
+            board (Board): The current game board, with the opponent to move.
+        """
+        expected = self.ai.minimax.pv[1:2]
+        self.start(self.search_replies, board.copy(), expected)
+
+    def poll(self):
+        """
+        Get the AI's move once it has been found.
+
+        Returns:
+            tuple: The move for the position last passed to think, or None if it is not ready.
+        """
+        with self.lock:
+            if self.wanted is None or self.wanted not in self.answers:
+                return None
+            move = self.answers[self.wanted]
+            self.wanted = None
+            return move
+
+    def cancel(self):
+        """
+        Stop the running search, if any, and wait for its thread to finish.
+        """
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.stop.clear()
+            self.thread = None
+
+    def start(self, target, *args):
+        """
+        Run a search job in a new thread, replacing the running one.
+        """
+        self.cancel()
+        self.thread = threading.Thread(target=target, args=args, daemon=True)
+        self.thread.start()
+
+    def search(self, board):
+        """
+        Search a position with the AI to move and remember the answer.
+        """
+        with self.lock:
+            self.searching = board.hash
+        try:
+            move = self.ai.eval(board)
+        except SearchAborted:
+            move = None
+        with self.lock:
+            ready = move is not None and not self.stop.is_set()
+            if ready:
+                self.answers[board.hash] = move
+            self.searching = None
+            ready = ready and board.hash == self.wanted
+        if ready and self.on_answer is not None:
+            self.on_answer()
+
+    def search_replies(self, board, expected):
+        """
+        Search the AI's answer to each reply of the opponent in turn, until stopped.
+        """
+        opponent = 3 - self.ai.player
+        replies = self.ai.minimax.ordered_moves(board, opponent, 0, expected[0] if expected else None, unique=False)
+        for row, col in replies:
+            if self.stop.is_set():
+                return
+            board.mark_sqr(row, col, opponent)
+            if not board.final_state() and not board.isfull():
+                self.search(board)
+            board.unmark_sqr(row, col)
@@ -0,0 +1,69 @@
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Mixed into the position hash when O is to move, so the same position
+# searched for different players gets different keys.
+O_TO_MOVE = 0x9E3779B97F4A7C15
+
+
+class TranspositionTable:
+    def __init__(self, size=1 << 16, replacement='depth'):
+        """
+        Initialize a fixed-size table of search results keyed by position hash.
+
+        Args:
+            size (int): The number of slots in the table.
+            replacement (str): 'depth' keeps the deeper of two colliding entries
+                unless the stored one is left over from an earlier search,
+                'always' keeps the newest.
+        """
+        if replacement not in ('depth', 'always'):
+            raise ValueError(f"Unknown replacement policy: {replacement}")
+        self.size = size
+        self.replacement = replacement
+        self.entries = [None] * size
+        self.generation = 0
+
+    def new_search(self):
+        """
+        Start a new search, letting its entries replace those of earlier searches.
+        """
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        Look up a position.
+
+        Args:
+            key (int): The position hash.
+
+        Returns:
+            tuple: The (key, depth, score, flag, move, generation) entry, or None if absent.
+        """
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        """
+        Store a search result, subject to the replacement policy.
+
+        Args:
+            key (int): The position hash.
+            depth (int): The remaining depth the position was searched to.
+            score (float): The score found by the search.
+            flag (int): EXACT, LOWER or UPPER, the kind of bound the score is.
+            move (tuple): The best move found, or -1.
+        """
+        index = key % self.size
+        entry = self.entries[index]
+        if (self.replacement == 'depth' and entry is not None and entry[0] != key
+                and entry[5] == self.generation and entry[1] > depth):
+            return
+        self.entries[index] = (key, depth, score, flag, move, self.generation)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        self.entries = [None] * self.size